@@ -3,5 +3,6 @@ from .sfdatafile import SFDataFile
 from .sfdatafiles import SFDataFiles
 from .sfscaninfo import SFScanInfo
 from .sfprocfile import SFProcFile
+from .vds import write_vds, read_vds_steps
 
 
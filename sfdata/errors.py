@@ -38,4 +38,11 @@ class ArrayLengthMismatch(SFDataError):
         super().__init__(msg)
 
 
+class UnorderedPidsError(SFDataError):
+
+    def __init__(self, name, last, first):
+        msg = f"Cannot concatenate channel \"{name}\" since the pulse IDs of its files overlap or are out of order: {last} is followed by {first}"
+        super().__init__(msg)
+
+
 
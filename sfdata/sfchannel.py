@@ -1,38 +1,86 @@
+from time import sleep, time
 from types import SimpleNamespace
 import numpy as np
 
 from .errors import DatasetNotInGroupError
-from .utils import typename, adjust_shape, batched, apply_batched, ClosedH5, FileStatus
+from .utils.h5 import auto_chunk_cache, open_with_chunk_cache
+from .utils import typename, adjust_shape, batched, apply_batched, h5_read_valid, dask_read_valid, prefetched, wrap_direct_chunks, mmap_dataset, mmap_read_valid, ClosedH5, FileStatus
 
 
 class SFChannel:
 
-    def __init__(self, name, group):
+    def __init__(self, name, group, cache=None, chunk_workers=None, tune_chunk_cache=False, mmap=False, meta=None):
         self.name = name
+        self.meta = meta # metadata from the index (see utils.metaindex), if available
         self._group = group
+        self.cache = cache
         self.fs = FileStatus(group.file.filename)
         self.datasets = SimpleNamespace(
-            data = get_dataset("data", group),
+            data = wrap_direct_chunks(get_dataset("data", group, tune_chunk_cache), chunk_workers), # unchanged unless direct chunk reads are possible
             pids = get_dataset("pulse_id", group),
             timestamps = group.get("timestamp") # treat timestamps as optional
         )
+        self.mmaps = make_mmaps(self.datasets) if mmap else {}
         self.offset = 0
         self.reset_valid()
 
     def close(self):
+        if self.cache is not None:
+            self.cache.invalidate(self.fs.name, self.name)
+        self.mmaps.clear() # arrays handed out before keep their mapping
         self._group = ClosedH5(self._group)
         self.datasets.data = ClosedH5(self.datasets.data)
         self.datasets.pids = ClosedH5(self.datasets.pids)
 
-    def in_batches(self, size=100, n=None):
-        dataset = self.datasets.data
+    def refresh(self):
+        """update the extents of the datasets, which grow while the file is still being written (see SFDataFile(follow=True))"""
+        for dataset in vars(self.datasets).values():
+            refresh = getattr(dataset, "refresh", None) # e.g., not for ju.File
+            if refresh is not None:
+                refresh()
+
+    def iter_new(self, poll=1, timeout=None, start=0):
+        """
+        Follow the channel while its file is still being written (see SFDataFile(follow=True)):
+        yield (pids, data) for the entries that were appended since the previous block, checking for new entries every poll seconds
+        the first block starts at entry start, start=None skips the entries that exist already
+        stop after timeout seconds without new entries, the default timeout=None never stops
+        valid is not applied, only complete entries (with data and pids) are yielded
+        """
+        self.refresh()
+        pos = self._count_complete() if start is None else start
+        last_new = time()
+        while True:
+            self.refresh()
+            stop = self._count_complete()
+            if stop > pos:
+                pids = self.datasets.pids[pos:stop]
+                data = self.datasets.data[pos:stop]
+                yield adjust_shape(pids) - self.offset, adjust_shape(data)
+                pos = stop
+                last_new = time()
+            elif timeout is not None and time() - last_new >= timeout:
+                return
+            else:
+                sleep(poll)
+
+    def _count_complete(self):
+        """number of entries for which both data and pids have been written"""
+        return min(len(self.datasets.data), len(self.datasets.pids))
+
+
+    def in_batches(self, size=100, n=None, prefetch=None, max_bytes=None, reuse_buffer=False):
+        if prefetch and reuse_buffer:
+            raise ValueError("cannot reuse the buffer for prefetched batches")
+        dataset = self._get_source("data")
         valid_indices = self._get_valid_indices()
-        return batched(dataset, valid_indices, size, nbatches=n)
+        batches = batched(dataset, valid_indices, size, nbatches=n, max_bytes=max_bytes, reuse_buffer=reuse_buffer)
+        return prefetched(batches, prefetch)
 
-    def apply_in_batches(self, func, size=100, n=None):
-        dataset = self.datasets.data
+    def apply_in_batches(self, func, size=100, n=None, out=None, dtype=None, workers=None, executor="thread", max_bytes=None):
+        dataset = self.datasets.data if executor == "process" else self._get_source("data") # processes open the file by name
         valid_indices = self._get_valid_indices()
-        return apply_batched(func, dataset, valid_indices, size, nbatches=n)
+        return apply_batched(func, dataset, valid_indices, size, nbatches=n, out=out, dtype=dtype, workers=workers, executor=executor, max_bytes=max_bytes)
 
 
     def __getitem__(self, key):
@@ -46,31 +94,60 @@ class SFChannel:
         key[0] = indices[first]
 
         key = tuple(key)
-        res = self.datasets.data.__getitem__(key)
+        res = self._get_source("data").__getitem__(key)
         return res
 
 
     @property
     def data(self):
-        return self._get(self.datasets.data)
+        return self._get("data")
 
     @property
     def pids(self):
-        return self._get(self.datasets.pids) - self.offset
+        return self._get("pids") - self.offset
 
     @property
     def timestamps(self):
-        ts = self.datasets.timestamps
-        if ts is None:
+        if self.datasets.timestamps is None:
             return None
         # 0123456789xyzABCDEF -> 0123456789 unix timestamp in seconds, xyz milliseconds, ABCDEF last 6 digits of pulse ID
-        return self._get(ts).astype("datetime64[ns]") 
-
-    def _get(self, dataset):
-        res = dataset[:][self.valid] #TODO: workaround: access from h5 via indices is slow
+        return self._get("timestamps").astype("datetime64[ns]") 
+
+    def to_dask(self):
+        """data as lazy dask array, which reads from the file only when computed"""
+        return dask_read_valid(self._get_source("data"), self.valid)
+
+    def _get(self, which):
+        dataset = getattr(self.datasets, which)
+        cache = self.cache
+        mm = self.mmaps.get(which)
+        if mm is not None:
+            res = mmap_read_valid(mm, self.valid)
+        elif cache is not None and which in cache.which:
+            res = self._get_cached(cache, which, dataset)
+        else:
+            res = h5_read_valid(dataset, self.valid)
         res = adjust_shape(res)
         return res
 
+    def _get_source(self, which):
+        """memory-mapped array if available, otherwise the dataset"""
+        mm = self.mmaps.get(which)
+        if mm is not None:
+            return mm
+        return getattr(self.datasets, which)
+
+    def _get_cached(self, cache, which, dataset):
+        key = (self.fs.name, self.name, which)
+        raw = cache.get(key)
+        if raw is None:
+            raw = dataset[:]
+            cache.put(key, raw)
+        valid = self.valid
+        if valid is Ellipsis:
+            return raw.copy() # do not hand out views into the cache
+        return raw[valid]
+
     @property
     def dtype(self):
         return self.datasets.data.dtype
@@ -128,13 +205,30 @@ class SFChannel:
 
 
 
-def get_dataset(name, group):
+def make_mmaps(datasets):
+    mmaps = {}
+    for which, dataset in vars(datasets).items():
+        mm = mmap_dataset(dataset)
+        if mm is not None:
+            mmaps[which] = mm
+    return mmaps
+
+
+def get_dataset(name, group, tune_chunk_cache=False):
     try:
         res = group[name]
     except Exception as exc: #TODO: limit this to ValueError("Field names only allowed for compound types") ?
         raise DatasetNotInGroupError(name, group) from exc
-    else:
+
+    if not tune_chunk_cache:
         return res
 
+    settings = auto_chunk_cache(res)
+    if settings is None:
+        return res
+
+    del res # the new chunk cache settings only apply if the dataset is not open anymore
+    return open_with_chunk_cache(group, name, *settings)
+
 
 
@@ -4,15 +4,15 @@ from .sfchannel import SFChannel
 
 class SFChannelJF(SFChannel):
 
-    def __init__(self, name, juf):
+    def __init__(self, name, juf, cache=None):
         self.juf = juf
-        super().__init__(name, juf)
+        super().__init__(name, juf, cache=cache)
         self.datasets.data = juf # replace raw dataset with ju.File object
 
     @classmethod
-    def from_file(cls, juf):
+    def from_file(cls, juf, cache=None):
         name = juf.detector_name
-        return cls(name, juf)
+        return cls(name, juf, cache=cache)
 
     @property
     def shape(self):
@@ -22,6 +22,11 @@ class SFChannelJF(SFChannel):
         shape = (nimages, *image_shape)
         return shape
 
+    def apply_in_batches(self, func, size=100, n=None, out=None, dtype=None, workers=None, executor="thread", max_bytes=None):
+        if workers is not None and workers > 1 and executor == "process":
+            raise ValueError("unsupported executor \"process\" for JF channels: process workers would read the raw data without jungfrau_utils corrections, use executor=\"thread\"")
+        return super().apply_in_batches(func, size=size, n=n, out=out, dtype=dtype, workers=workers, executor=executor, max_bytes=max_bytes)
+
     def reset_valid(self):
         self.valid = Ellipsis
         # load "is_good_frame", check for any invalid entries, initialize from it
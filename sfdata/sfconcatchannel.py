@@ -0,0 +1,92 @@
+from types import SimpleNamespace
+
+from .errors import UnorderedPidsError
+from .utils import ConcatDataset
+from .sfchannel import SFChannel
+from .sflazychannel import SFLazyChannel
+
+
+class SFConcatChannel(SFChannel):
+    """
+    Channel that occurs in several files, concatenated along the pulse-id axis without copying:
+    - the parts (SFChannel or SFLazyChannel) are kept in file order, which is expected to follow the pulse ids (e.g., consecutive acquisitions)
+    - data, pids and timestamps are ConcatDatasets, i.e., reads are routed to the files that contain the requested rows
+    - valid, offset, in_batches, to_dask etc. work on the concatenated rows as for a single channel
+    - lazy parts are only materialized when the data is accessed
+    - the pulse ids of the parts need to be increasing and disjoint across the parts, which is checked on creation (or on materialization for lazy parts)
+    """
+
+    def __init__(self, name, parts):
+        self.name = name
+        self.parts = list(parts)
+        self.cache = None # the parts' datasets are read directly
+        self.mmaps = {} # the parts' memory maps are used via their sources
+        self.offset = 0
+        self._pids_checked = False
+        self.reset_valid()
+        if not any(isinstance(p, SFLazyChannel) for p in self.parts):
+            self._check_pid_order(self.parts)
+
+    def close(self):
+        for p in self.parts:
+            p.close()
+
+    def refresh(self):
+        for ch in self.channels:
+            ch.refresh()
+        self._pids_checked = False # the files might have grown
+
+    def apply_in_batches(self, func, size=100, n=None, out=None, dtype=None, workers=None, executor="thread", max_bytes=None):
+        if workers is not None and workers > 1 and executor == "process":
+            raise ValueError("unsupported executor \"process\" for concatenated channels: process workers can only open a single file, use executor=\"thread\"")
+        return super().apply_in_batches(func, size=size, n=n, out=out, dtype=dtype, workers=workers, executor=executor, max_bytes=max_bytes)
+
+    @property
+    def channels(self):
+        channels = [p.materialize() if isinstance(p, SFLazyChannel) else p for p in self.parts]
+        self._check_pid_order(channels)
+        return channels
+
+    @property
+    def datasets(self):
+        return concat_datasets(self.channels) # cheap, and accessing closed parts raises ClosedH5Error
+
+    def _check_pid_order(self, channels):
+        if not self._pids_checked:
+            check_pid_order(self.name, channels)
+            self._pids_checked = True
+
+
+
+def check_pid_order(name, channels):
+    """raise UnorderedPidsError if the raw pids of consecutive non-empty channels are not increasing, which reads only the first and last pid of each channel"""
+    last = None
+    for ch in channels:
+        pids = ch.datasets.pids
+        n = len(pids)
+        if n == 0:
+            continue
+        first = pids[0]
+        if last is not None and last >= first:
+            raise UnorderedPidsError(name, last, first)
+        last = pids[n - 1]
+
+
+def concat_datasets(channels):
+    name = channels[0].name
+    concat = lambda which: ConcatDataset([ch._get_source(which) for ch in channels], name=f"{name}/{which}")
+    has_timestamps = all(ch.datasets.timestamps is not None for ch in channels) # timestamps are optional
+    return SimpleNamespace(
+        data = concat("data"),
+        pids = concat("pids"),
+        timestamps = concat("timestamps") if has_timestamps else None
+    )
+
+
+def concat_channels(existing, chan):
+    """append chan to existing, which is either a single channel or an SFConcatChannel"""
+    parts = existing.parts if isinstance(existing, SFConcatChannel) else [existing]
+    return SFConcatChannel(chan.name, [*parts, chan])
+
+
+
@@ -1,10 +1,11 @@
-from functools import reduce #, partial
 import numpy as np
 import pandas as pd
 import xarray as xr
 from tqdm import tqdm
 
-from .utils import typename, percentage_missing, strlen, maxstrlen, decide_color, print_line, dip, cprint, ncprint, decide_pandas_dtype
+from .utils import typename, percentage_missing, strlen, maxstrlen, decide_color, print_line, dip, cprint, ncprint, decide_pandas_dtype, make_wide_dataframe, make_filled_column, intersect_pids, union_pids, shared_indices, pid_range_counts
+from .utils.metaindex import make_pid_meta
+from .sflazychannel import SFLazyChannel
 
 from collections import UserDict
 
@@ -28,17 +29,20 @@ class SFData(_Nooverwritedict):
 
     @property
     def pids(self):
-        return reduce(np.intersect1d, self._iter_pids())
+        return intersect_pids(self._iter_pids())
 
     @property
     def all_pids(self):
-        return reduce(np.union1d, self._iter_pids())
+        return union_pids(self._iter_pids())
 
     def _iter_pids(self):
         return (c.pids for c in self.values())
 
 
-    def to_dataframe(self, as_lists=False, as_nullable=False, show_progress=False):
+    def to_dataframe(self, as_lists=False, as_nullable=False, show_progress=False, wide=False):
+        if wide:
+            return self._to_dataframe_wide(as_nullable=as_nullable, show_progress=show_progress)
+
         data_series = {}
         channels = self.values()
         if show_progress:
@@ -54,6 +58,17 @@ class SFData(_Nooverwritedict):
         df = pd.DataFrame(data_series)
         return df
 
+    def _to_dataframe_wide(self, as_nullable=False, show_progress=False):
+        frames = []
+        channels = self.values()
+        if show_progress:
+            channels = tqdm(channels)
+        for chan in channels:
+            df = make_wide_dataframe(chan.name, chan.pids, chan.data, as_nullable=as_nullable)
+            frames.append(df)
+        df = pd.concat(frames, axis=1, sort=True, copy=False)
+        return df
+
     def to_dataframe_accumulate(self, as_lists=False, as_nullable=False, show_progress=False):
         all_pids = self.all_pids
         df = pd.DataFrame(index=all_pids, columns=self.names)
@@ -71,31 +86,28 @@ class SFData(_Nooverwritedict):
         return df
 
     def to_dataframe_fill(self, as_lists=False, as_nullable=False, show_progress=False):
-        all_pids = self.all_pids
-        df = pd.DataFrame(index=all_pids, columns=self.names, dtype=object) # object dtype makes sure NaN can be used as missing marker also for int/bool
+        all_pids = self.all_pids # sorted and unique, thus each channel's rows can be found via searchsorted
+        nrows = len(all_pids)
+        columns = {}
         channels = self.values()
         if show_progress:
             channels = tqdm(channels)
         for chan in channels:
             name = chan.name
             data = chan.data
-            if data.ndim > 1:
-                data = data.tolist() if as_lists else list(data)
-            which = np.isin(all_pids, chan.pids)
-            df.loc[which, name] = data
-            if as_nullable:
-                dtype = decide_pandas_dtype(data)
-                df[name] = df[name].astype(dtype)
+            rows = np.searchsorted(all_pids, chan.pids)
+            columns[name] = make_filled_column(nrows, rows, data, as_lists=as_lists, as_nullable=as_nullable)
+        df = pd.DataFrame(columns, index=all_pids, columns=self.names)
         return df
 
-    def to_xarray(self, show_progress=False):
+    def to_xarray(self, show_progress=False, lazy=False):
         data_vars = {}
         channels = self.values()
         if show_progress:
             channels = tqdm(channels)
         for chan in channels:
             name = chan.name
-            data = chan.data
+            data = chan.to_dask() if lazy else chan.data # pids are always read
             coords = {"pids": chan.pids}
             dims = ["pids"] + [f"_dim{i}_{name}" for i in range(1, data.ndim)]
             da = xr.DataArray(data, coords=coords, dims=dims)
@@ -119,14 +131,14 @@ class SFData(_Nooverwritedict):
 
 
     def drop_missing(self, show_progress=False):
-        shared_pids = self.pids
-        channels = self.values()
-        if show_progress:
-            channels = tqdm(channels)
-        for chan in channels:
+        channels = list(self.values())
+        pids = []
+        for chan in (tqdm(channels) if show_progress else channels):
             chan.reset_valid()
-            _inters, ind_chan, _ind_shared = np.intersect1d(chan.pids, shared_pids, return_indices=True)
-            chan.valid = ind_chan
+            pids.append(chan.pids) # read each channel's pids only once
+        valids = shared_indices(pids)
+        for chan, valid in zip(channels, valids):
+            chan.valid = valid
 
 
     def print_stats(self, show_complete=False, color=True):
@@ -134,11 +146,8 @@ class SFData(_Nooverwritedict):
 
         fprint = cprint if color else ncprint
 
-        shared_pids = self.pids
-        all_pids = self.all_pids
-
-        n_shared_pids = len(shared_pids)
-        n_all_pids = len(all_pids)
+        names = sorted(self.names)
+        n_shared_pids, n_all_pids, n_inters_per_chan = self._pid_counts(names)
         max_perc = percentage_missing(n_shared_pids, n_all_pids)
 
         len_pids = strlen(n_all_pids)
@@ -147,14 +156,9 @@ class SFData(_Nooverwritedict):
 
         print_line()
 
-        n_total = len(self.names)
+        n_total = len(names)
         n_complete = 0
-        for n in sorted(self.names):
-            chan = self[n]
-            chan.reset_valid()
-            inters = np.intersect1d(chan.pids, all_pids)
-            n_inters = len(inters)
-
+        for n, n_inters in zip(names, n_inters_per_chan):
             is_complete = (n_inters == n_all_pids)
             if is_complete:
                 n_complete += 1
@@ -166,7 +170,7 @@ class SFData(_Nooverwritedict):
             s_perc = str(perc).rjust(len_perc)
 
             color = decide_color(n_inters, n_shared_pids, n_all_pids)
-            fprint(chan.name.ljust(len_name), f"{s_n_inters} / {n_all_pids} -> {s_perc}% loss", dip(perc), color=color)
+            fprint(n.ljust(len_name), f"{s_n_inters} / {n_all_pids} -> {s_perc}% loss", dip(perc), color=color)
 
         print()
         color = decide_color(n_shared_pids, n_shared_pids, n_all_pids)
@@ -180,6 +184,31 @@ class SFData(_Nooverwritedict):
 
         print_line()
 
+    def _pid_counts(self, names):
+        """
+        Numbers of shared pids and of all pids, and for each of the channels names the number of its pids within all pids.
+        If the metadata index shows that all channels have complete pid ranges, no pids are read.
+        Since the counts of the intersections cannot be derived from the statistics of channels with gaps,
+        this only applies if none of the channels misses any pid within its range. Otherwise all pids are read.
+        """
+        ranges = [get_pid_range(self.data[n]) for n in names] # the raw dict keeps lazy channels lazy
+        if all(r is not None for r in ranges):
+            n_shared_pids, n_all_pids = pid_range_counts(ranges)
+            n_inters_per_chan = [stop - start for start, stop in ranges] # each range is part of all pids
+            return n_shared_pids, n_all_pids, n_inters_per_chan
+
+        shared_pids = self.pids
+        all_pids = self.all_pids
+
+        n_inters_per_chan = []
+        for n in names:
+            chan = self[n]
+            chan.reset_valid()
+            inters = intersect_pids((chan.pids, all_pids))
+            n_inters_per_chan.append(len(inters))
+
+        return len(shared_pids), len(all_pids), n_inters_per_chan
+
 
     def reset_valid(self):
         channels = self.values()
@@ -194,9 +223,9 @@ class SFData(_Nooverwritedict):
             f.writelines(data)
 
     def __getitem__(self, key):
-        super_getitem = super().__getitem__
         if isinstance(key, str):
-            return super_getitem(key)
+            return self._get_channel(key)
+        super_getitem = super().__getitem__
         try:
             chans = {k: super_getitem(k) for k in key} #TODO: should subsetting copy channels (separate .valid)?
         except TypeError as exc:
@@ -204,7 +233,49 @@ class SFData(_Nooverwritedict):
         else:
             return SFData(chans)
 
+    def _get_channel(self, name):
+        chan = super().__getitem__(name)
+        if isinstance(chan, SFLazyChannel):
+            chan = chan.materialize()
+            self.data[name] = chan # replace placeholder, bypassing the overwrite check
+        return chan
+
     def __repr__(self):
         tn = typename(self)
         entries = len(self)
         return f"{tn}: {entries} channels"
+
+
+
+def get_pid_range(chan):
+    """
+    Pid range [start, stop) of chan from the metadata index (see utils.metaindex)
+    if its pids are known to be complete, i.e., sorted, unique and without gaps, otherwise None.
+    If the index does not contain the pid statistics yet, the pids are read once and the statistics are added to the index.
+    """
+    if isinstance(chan, SFLazyChannel) and chan.is_materialized:
+        chan = chan.materialize()
+
+    meta = getattr(chan, "meta", None)
+    if meta is None or getattr(chan, "valid", Ellipsis) is not Ellipsis: # the index does not know about valid
+        return None
+
+    pids = meta["pids"]
+    if pids is None:
+        if isinstance(chan, SFLazyChannel):
+            chan = chan.materialize()
+        pids = meta["pids"] = make_pid_meta(chan.pids + chan.offset) # valid is Ellipsis, i.e., these are the raw pids
+    count = pids["count"]
+    if count == 0:
+        return (0, 0)
+
+    start = pids["min"]
+    stop  = pids["max"] + 1
+    if not pids["sorted"] or stop - start != count:
+        return None
+
+    offset = getattr(chan, "offset", 0)
+    return (start - offset, stop - offset)
+
+
+
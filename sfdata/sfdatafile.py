@@ -4,10 +4,13 @@ import h5py
 import bitshuffle.h5
 
 from .errors import NoUsableChannelError
-from .utils import typename, enquote, print_skip_warning, FileContext, FileStatus
+from .utils.h5 import RDCC_KWARGS
+from .utils.metaindex import get_meta_index_dir, get_meta, update_meta_index, count_pid_meta
+from .utils import typename, enquote, print_skip_warning, make_cache, FileContext, FileStatus
 from .sfdata import SFData
 from .sfchannel import SFChannel
 from .sfchanneljf import SFChannelJF
+from .sflazychannel import SFLazyChannel
 
 #TODO: treat ju as optional for now
 try:
@@ -18,16 +21,24 @@ except ImportError:
 
 class SFDataFile(FileContext, SFData):
 
-    def __init__(self, fname):
+    def __init__(self, fname, cache=None, cache_bytes=None, lazy=False, chunk_workers=None, mmap=False, meta_index=None, follow=False, **h5_kwargs):
+        if follow:
+            h5_kwargs["swmr"] = True # read a file that is still being written, the writer needs to have enabled SWMR mode
+            meta_index = None # the metadata of a growing file is outdated immediately
         self.fname = fname
         self.fs = FileStatus(fname)
-        self.file, channels = load_from_file(fname)
+        self.cache = make_cache(cache, cache_bytes)
+        self.meta_index_dir = get_meta_index_dir(meta_index)
+        self.file, channels, self.metas = load_from_file(fname, cache=self.cache, lazy=lazy, chunk_workers=chunk_workers, mmap=mmap, index_dir=self.meta_index_dir, **h5_kwargs)
+        self.npid_metas = count_pid_meta(self.metas) if self.metas is not None else 0
         super().__init__(channels)
 
     def close(self):
-        for ch in self.channels:
+        for ch in self.data.values(): # the raw dict values do not materialize lazy channels
             ch.close() # channels should be closed before the underlying file such that file name and group name still exist and can be used in error messages
         self.file.close()
+        if self.metas is not None and count_pid_meta(self.metas) > self.npid_metas: # pid statistics were added while the file was open
+            update_meta_index(self.fs, self.meta_index_dir, self.metas)
 
     def __repr__(self):
         tn = typename(self)
@@ -37,47 +48,74 @@ class SFDataFile(FileContext, SFData):
 
 
 
-def load_from_file(fname):
+def load_from_file(fname, cache=None, lazy=False, chunk_workers=None, mmap=False, index_dir=None, **h5_kwargs):
+    """returns the opened file, its channels and the channel metadata from the index in index_dir (None without index)"""
     if ".JF" in fname: #TODO: might need better check
         if ju:
-            return load_from_ju_file(fname)
+            if h5_kwargs: # ju.File opens the file itself and does not accept h5py.File arguments
+                args = ", ".join(h5_kwargs)
+                warn(f"jungfrau_utils does not support h5py.File arguments, ignoring for JF files: {args}", stacklevel=2)
+            return load_from_ju_file(fname, cache=cache)
         else:
             warn("Could not import jungfrau_utils, will treat JF files as regular files.", stacklevel=2)
 
-    return load_from_generic_file(fname)
+    return load_from_generic_file(fname, cache=cache, lazy=lazy, chunk_workers=chunk_workers, mmap=mmap, index_dir=index_dir, **h5_kwargs)
 
 
-def load_from_ju_file(fname):
+def load_from_ju_file(fname, cache=None):
     juf = ju.File(fname)
     name = juf.detector_name
-    chan = SFChannelJF(name, juf)
-    return juf, {name: chan}
+    chan = SFChannelJF(name, juf, cache=cache)
+    return juf, {name: chan}, None
 
 
-def load_from_generic_file(fname):
-    h5 = h5py.File(fname, mode="r")
+def load_from_generic_file(fname, cache=None, lazy=False, chunk_workers=None, mmap=False, index_dir=None, **h5_kwargs):
+    h5 = h5py.File(fname, mode="r", **h5_kwargs)
+    tune_chunk_cache = not any(k in h5_kwargs for k in RDCC_KWARGS) # explicit chunk cache settings take precedence
 
     if "data" in h5:
         data = h5["data"] # some files have /data/, e.g., bsread
     else:
         data = h5 # some files do not, e.g., camera
 
+    metas = get_meta(FileStatus(fname), index_dir, data) if index_dir else None # the names of valid channels are known, no need to check the groups again
+
+    if lazy or metas is not None: # with the index, the datasets are only opened on access
+        channels = make_lazy_channels(data, cache, chunk_workers, tune_chunk_cache, mmap, metas)
+    else:
+        channels = make_channels(data, cache, chunk_workers, tune_chunk_cache, mmap)
+
+    if not channels:
+        raise NoUsableChannelError(fname)
+
+    return h5, channels, metas
+
+
+def make_channels(data, cache, chunk_workers=None, tune_chunk_cache=False, mmap=False):
     channels = {}
     for name in data:
         group = data[name]
         try:
-            chan = SFChannel(name, group)
+            chan = SFChannel(name, group, cache=cache, chunk_workers=chunk_workers, tune_chunk_cache=tune_chunk_cache, mmap=mmap)
         except Exception as exc:
             cn = enquote(name)
             cn = f"channel {cn}"
             print_skip_warning(exc, cn)
         else:
             channels[name] = chan
+    return channels
 
-    if not channels:
-        raise NoUsableChannelError(fname)
 
-    return h5, channels
+def make_lazy_channels(data, cache, chunk_workers=None, tune_chunk_cache=False, mmap=False, metas=None):
+    if metas is not None:
+        return {name: SFLazyChannel(name, data, cache=cache, chunk_workers=chunk_workers, tune_chunk_cache=tune_chunk_cache, mmap=mmap, meta=meta) for name, meta in metas.items()}
+
+    channels = {}
+    for name in data:
+        if data.get(name, getclass=True) is not h5py.Group: # only reads the link, not the datasets
+            continue
+        channels[name] = SFLazyChannel(name, data, cache=cache, chunk_workers=chunk_workers, tune_chunk_cache=tune_chunk_cache, mmap=mmap)
+    return channels
 
 
 
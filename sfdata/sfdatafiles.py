@@ -1,18 +1,28 @@
+from functools import partial
 from glob import glob
 
 from .errors import NoMatchingFileError
-from .utils import typename, enquote, printable_string_sequence, print_skip_warning, FileContext
+from .utils import typename, enquote, printable_string_sequence, print_skip_warning, make_cache, parallel_map, FileContext
 from .sfdata import SFData
 from .sfdatafile import SFDataFile
+from .sfconcatchannel import concat_channels
 from .ign import remove_ignored_filetypes_run
 
 
 class SFDataFiles(FileContext, SFData):
 
-    def __init__(self, *patterns):
+    def __init__(self, *patterns, cache=None, cache_bytes=None, lazy=False, workers=None, chunk_workers=None, mmap=False, meta_index=None, follow=False, **h5_kwargs):
         super().__init__()
         self.fnames = []
         self.files = []
+        self.cache = make_cache(cache, cache_bytes) # shared by all files
+        self.lazy = lazy
+        self.workers = workers
+        self.chunk_workers = chunk_workers
+        self.mmap = mmap
+        self.meta_index = meta_index
+        self.follow = follow
+        self.h5_kwargs = h5_kwargs # passed on to h5py.File
         self.load(*patterns)
 
 
@@ -31,18 +41,31 @@ class SFDataFiles(FileContext, SFData):
 
     def load(self, *patterns): #TODO: check if fnames/file already in self.fnames/self.files?
         fnames = explode_filenames(patterns)
-        fnames, files = load_files(fnames)
+        fnames, files = load_files(fnames, cache=self.cache, lazy=self.lazy, workers=self.workers, chunk_workers=self.chunk_workers, mmap=self.mmap, meta_index=self.meta_index, follow=self.follow, **self.h5_kwargs)
 
         if not files:
             patterns = printable_string_sequence(patterns)
             raise NoMatchingFileError(patterns)
 
-        for f in files:
-            self.update(f)
+        try:
+            for f in files:
+                for name, chan in f.data.items(): # the raw dict keeps lazy channels lazy
+                    self._add_channel(name, chan)
+        except Exception:
+            for f in files:
+                f.close()
+            raise
 
         self.fnames.extend(fnames)
         self.files.extend(files)
 
+    def _add_channel(self, name, chan):
+        existing = self.data.get(name)
+        if existing is None:
+            self[name] = chan
+        else:
+            self.data[name] = concat_channels(existing, chan) # channels that occur in several files are appended along the pulse-id axis
+
 
 
 def explode_filenames(patterns):
@@ -54,13 +77,13 @@ def explode_filenames(patterns):
     return fnames
 
 
-def load_files(fnames):
+def load_files(fnames, cache=None, lazy=False, workers=None, chunk_workers=None, mmap=False, meta_index=None, follow=False, **h5_kwargs):
     fnames = remove_ignored_filetypes_run(fnames)
+    open_file = partial(try_open_file, cache=cache, lazy=lazy, chunk_workers=chunk_workers, mmap=mmap, meta_index=meta_index, follow=follow, **h5_kwargs)
+    opened = parallel_map(open_file, fnames, workers=workers) # keeps the order of fnames, i.e., the order of the parts of concatenated channels
     res = {}
-    for fn in fnames:
-        try:
-            f = SFDataFile(fn)
-        except Exception as exc:
+    for fn, (f, exc) in zip(fnames, opened):
+        if exc is not None:
             quoted_fn = enquote(fn)
             print_skip_warning(exc, quoted_fn)
         else:
@@ -69,6 +92,13 @@ def load_files(fnames):
     return fnames, files
 
 
+def try_open_file(fn, **kwargs):
+    try:
+        return SFDataFile(fn, **kwargs), None
+    except Exception as exc:
+        return None, exc
+
+
 def dict_to_tuples(d):
     keys   = d.keys()
     values = d.values()
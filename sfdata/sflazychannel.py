@@ -0,0 +1,70 @@
+import numpy as np
+
+from .utils import typename, ClosedH5
+from .sfchannel import SFChannel
+
+
+class SFLazyChannel:
+    """
+    Placeholder for a channel that has not been accessed yet:
+    - creating it does not touch the group or its datasets
+    - the actual SFChannel (including the check for the required datasets) is created on first access
+    - the created SFChannel is kept, i.e., all SFData objects holding the placeholder get the same channel
+    - with metadata from the index (see utils.metaindex), shape, dtype, ntotal and len are answered without opening the datasets
+    """
+
+    def __init__(self, name, parent, cache=None, chunk_workers=None, tune_chunk_cache=False, mmap=False, meta=None):
+        self.name = name
+        self._parent = parent
+        self.cache = cache
+        self.chunk_workers = chunk_workers
+        self.tune_chunk_cache = tune_chunk_cache
+        self.mmap = mmap
+        self.meta = meta
+        self._channel = None
+
+    @property
+    def is_materialized(self):
+        return self._channel is not None
+
+    def materialize(self):
+        if self._channel is None:
+            group = self._parent[self.name]
+            self._channel = SFChannel(self.name, group, cache=self.cache, chunk_workers=self.chunk_workers, tune_chunk_cache=self.tune_chunk_cache, mmap=self.mmap, meta=self.meta)
+        return self._channel
+
+    @property
+    def shape(self):
+        if self._channel is None and self.meta is not None: # valid is Ellipsis until materialized
+            return tuple(self.meta["shape"])
+        return self.materialize().shape
+
+    @property
+    def dtype(self):
+        if self._channel is None and self.meta is not None:
+            return np.dtype(self.meta["dtype"])
+        return self.materialize().dtype
+
+    @property
+    def ntotal(self):
+        if self._channel is None and self.meta is not None:
+            return self.meta["ntotal"]
+        return self.materialize().ntotal
+
+    def __len__(self):
+        if self._channel is None and self.meta is not None:
+            return self.meta["ntotal"]
+        return len(self.materialize())
+
+    def close(self):
+        if self._channel is not None:
+            self._channel.close()
+        self._parent = ClosedH5(self._parent) # accessing after closing raises ClosedH5Error
+
+    def __repr__(self):
+        tn = typename(self)
+        name = self.name
+        return f"{tn}: {name}"
+
+
+
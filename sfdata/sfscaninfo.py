@@ -1,15 +1,24 @@
 from collections.abc import Sequence
+from functools import partial
+from warnings import warn
+import numpy as np
+import xarray as xr
 from .errors import NoMatchingFileError, NoUsableFileError
-from .utils import typename, enquote, adjust_shape, json_load, print_skip_warning, FileStatus
+from .utils import typename, enquote, adjust_shape, json_load, print_skip_warning, prefetched, parallel_map, FileStatus
+from .utils.stats import REDUCTIONS, REDUCE_BATCH_NBYTES, RunningStats
+from .utils.metaindex import get_meta_index_dir, load_meta_index, update_meta_index
 from .sfdatafiles import SFDataFiles
 from .ign import remove_ignored_filetypes_scan
+from .vds import write_vds_steps
 
 
 class SFScanInfo(Sequence):
 
-    def __init__(self, fname):
+    def __init__(self, fname, meta_index=None):
         self.fname = fname
         self.fs = FileStatus(fname)
+        self.meta_index = meta_index # directory for persisting the pid index (see utils.metaindex)
+        self._pid_index = None
         self.info = info = json_load(fname)
 
         self.files      = info["scan_files"]
@@ -26,6 +35,77 @@ class SFScanInfo(Sequence):
 #        return (SFDataFiles(*fns) for fns in self.files) #TODO: errors stop the iteration. do we want this?
         return generate_sfdata(self.files)
 
+    def iter(self, prefetch=None, channels=None, **kwargs):
+        """
+        Iterate over the steps like iter(scan), but open the next prefetch steps in a background thread
+        while the current step is processed, and (optionally) read the given channels of these steps into the cache.
+        kwargs are passed on to SFDataFiles.
+        """
+        return generate_sfdata(self.files, prefetch=prefetch, channels=channels, **kwargs)
+
+    def map(self, func, channels=None, drop_missing=False, workers=None, executor="thread", **kwargs):
+        """
+        Apply func to each step (the SFDataFiles object, or its subset of channels) in a pool of workers (see parallel_map),
+        optionally after dropping missing pulse ids (see drop_missing).
+        The results are returned in step order, i.e., aligned with values and readbacks.
+        Steps that cannot be opened are skipped with a warning and give None.
+        With executor="process", func needs to be picklable, e.g., a module-level function.
+        kwargs are passed on to SFDataFiles.
+        """
+        return map_sfdata(func, self.files, channels=channels, drop_missing=drop_missing, workers=workers, executor=executor, **kwargs)
+
+    def reduce(self, reductions, drop_missing=True, bins=None, workers=None, executor="thread", **kwargs):
+        """
+        Calculate statistics per step for the channels given as reductions, e.g., {"ch": ["mean", "std", "count"]} (see REDUCTIONS),
+        streaming each step through in_batches (see RunningStats), i.e., the memory consumption does not depend on the number of entries.
+        bins are the histogram bin edges, which are needed for "hist".
+        Returns an xarray Dataset with one variable "<channel>_<statistic>" per reduction along the dimension of the steps,
+        with the scan values and readbacks as coordinates. Steps that cannot be opened give NaN (and count 0).
+        For scans of a single parameter, the dimension is indexed by the scan values, i.e., ds.sel(<parameter>=value) works,
+        for several parameters, the dimension is "step" (the step index) and the scan values are non-index coordinates.
+        The other arguments are the same as for map.
+        """
+        reductions = normalize_reductions(reductions, bins)
+        func = partial(reduce_step, reductions=reductions, bins=bins)
+        results = self.map(func, channels=list(reductions), drop_missing=drop_missing, workers=workers, executor=executor, **kwargs)
+        coords, names = make_step_coords(self.values, self.readbacks, self.parameters)
+        ds = make_reduced_dataset(results, reductions, coords)
+        if len(names) == 1:
+            ds = ds.swap_dims(step=names[0]) # step stays available as coordinate
+        return ds
+
+    @property
+    def pid_index(self):
+        """
+        pid min/max/count per step (None for steps that cannot be opened), built once by reading the pids of all steps.
+        Only if meta_index is given, it is persisted in the index for the scan's json file (keyed on its path, size and modification time)
+        and rebuilt if any of the step files changes, otherwise it is rebuilt for each SFScanInfo object.
+        """
+        if self._pid_index is None:
+            index_dir = get_meta_index_dir(self.meta_index)
+            collect = lambda: map_sfdata(step_pid_stats, self.files, lazy=True)
+            self._pid_index = get_step_index(self.fs, index_dir, self.files, collect) if index_dir else collect()
+        return self._pid_index
+
+    def step_of(self, pids):
+        """index of the step whose pid range contains each of pids, -1 for pids outside of all steps (see find_steps for overlapping steps)"""
+        return find_steps(self.pid_index, pids)
+
+    def select_pids(self, pids, channels=None, **kwargs):
+        """
+        Iterate over (step index, step) for the steps that contain any of pids, without opening the other steps,
+        with the valid marker of each channel (default: all channels) set to the entries of pids
+        kwargs are passed on to SFDataFiles
+        """
+        pids = np.asanyarray(pids)
+        steps = self.step_of(pids)
+        files = remove_ignored_filetypes_scan(self.files) # same files as for the pid index
+        for i in np.unique(steps[steps >= 0]):
+            with SFDataFiles(*files[i], **kwargs) as data:
+                step = data if channels is None else data[channels]
+                select_valid(step, pids)
+                yield int(i), step
+
     def __getitem__(self, index):
         fns = self.files[index]
         if isinstance(index, slice):
@@ -35,6 +115,11 @@ class SFScanInfo(Sequence):
     def __len__(self):
         return len(self.files)
 
+    def write_vds(self, fname, mode="x"):
+        """write the HDF5 file fname that maps the channels of all steps via virtual datasets including the step boundaries (see write_vds_steps)"""
+        files = remove_ignored_filetypes_scan(self.files)
+        write_vds_steps(fname, files, mode=mode)
+
 
     def __repr__(self):
         tn = typename(self)
@@ -44,12 +129,20 @@ class SFScanInfo(Sequence):
 
 
 
-def generate_sfdata(fnames):
+def generate_sfdata(fnames, prefetch=None, channels=None, **kwargs):
     fnames = remove_ignored_filetypes_scan(fnames)
+    if channels:
+        kwargs.setdefault("cache", True) # keep the read arrays for the actual access
+
+    opened = (open_step(fns, channels, **kwargs) for fns in fnames)
+    opened = prefetched(opened, prefetch, discard=close_step)
+
     nothing_opened = True
-    for i, fns in enumerate(fnames):
+    for i, (fns, data, exc) in enumerate(opened):
         try:
-            with SFDataFiles(*fns) as data: #TODO: is this what we want? does it even work? maybe explict .close() after yield is better?
+            if exc is not None:
+                raise exc
+            with data: #TODO: is this what we want? does it even work? maybe explict .close() after yield is better?
                 yield data
             nothing_opened = False
         except Exception as exc:
@@ -59,4 +152,213 @@ def generate_sfdata(fnames):
         raise NoUsableFileError
 
 
+def map_sfdata(func, fnames, channels=None, drop_missing=False, workers=None, executor="thread", **kwargs):
+    fnames = remove_ignored_filetypes_scan(fnames)
+    apply = partial(apply_to_step, func, channels=channels, drop_missing=drop_missing, **kwargs)
+    applied = parallel_map(apply, fnames, workers=workers, executor=executor)
+
+    results = []
+    nothing_opened = True
+    for i, (fns, (res, exc)) in enumerate(zip(fnames, applied)):
+        if exc is None:
+            nothing_opened = False
+        else:
+            sn = f"step {i} {fns}"
+            print_skip_warning(exc, sn)
+        results.append(res)
+    if nothing_opened:
+        raise NoUsableFileError
+    return results
+
+
+def apply_to_step(func, fns, channels=None, drop_missing=False, **kwargs):
+    """
+    Open the files of a step, select the channels and drop missing pulse ids, then apply func,
+    returns the result and the exception that occurred before func was applied (if any)
+    errors raised in func propagate
+    """
+    try:
+        data = SFDataFiles(*fns, **kwargs)
+    except Exception as exc:
+        return None, exc
+
+    with data:
+        try:
+            step = data if channels is None else data[channels]
+            if drop_missing:
+                step.drop_missing()
+        except Exception as exc:
+            return None, exc
+        return func(step), None
+
+
+def normalize_reductions(reductions, bins=None):
+    """{channel: reduction or list of reductions} -> {channel: list of reductions}, checking the reductions before opening any file"""
+    res = {}
+    for name, which in reductions.items():
+        which = [which] if isinstance(which, str) else list(which)
+        unknown = sorted(set(which) - set(REDUCTIONS))
+        if unknown:
+            raise ValueError(f"unknown reductions {unknown} for channel {name!r}, can only calculate: {REDUCTIONS}")
+        if "hist" in which and bins is None:
+            raise ValueError("the histogram bin edges (bins) are needed for \"hist\"")
+        res[name] = which
+    return res
+
+
+def reduce_step(data, reductions, bins=None):
+    res = {}
+    for name, which in reductions.items():
+        stats = RunningStats(bins=bins if "hist" in which else None)
+        for _indices, batch in data[name].in_batches(size="auto", max_bytes=REDUCE_BATCH_NBYTES):
+            stats.update(batch)
+        res[name] = {w: stats.get(w) for w in which}
+    return res
+
+
+def make_step_coords(values, readbacks, parameters):
+    """scan values and readbacks along the dimension step, one coordinate each per scan parameter, and the names of the scan parameters"""
+    nsteps = len(values)
+    values    = np.reshape(values,    (nsteps, -1))
+    readbacks = np.reshape(readbacks, (nsteps, -1))
+    names = parameters.get("name") or [f"parameter{i}" for i in range(values.shape[1])]
+    coords = {"step": np.arange(nsteps)}
+    for i, name in enumerate(names):
+        coords[name] = ("step", values[:, i])
+        coords[f"{name}_readback"] = ("step", readbacks[:, i])
+    return coords, names
+
+
+def make_reduced_dataset(results, reductions, coords):
+    data_vars = {}
+    for name, which in reductions.items():
+        for w in which:
+            entries = [None if r is None else r[name][w] for r in results] # None for failed steps
+            data = stack_steps(entries, fill=0 if w == "count" else np.nan)
+            if w == "hist":
+                other_dims = [f"_bin_{name}"]
+            else:
+                other_dims = [f"_dim{i}_{name}" for i in range(1, data.ndim)]
+            data_vars[f"{name}_{w}"] = xr.DataArray(data, dims=["step", *other_dims])
+    return xr.Dataset(data_vars, coords=coords)
+
+
+def stack_steps(entries, fill):
+    """stack the entries per step into one array, missing entries (None) are filled with fill"""
+    present = [np.asanyarray(e) for e in entries if e is not None]
+    shape = present[0].shape if present else ()
+    dtype = np.result_type(*present, fill) if present else type(fill)
+    res = np.full((len(entries), *shape), fill, dtype=dtype)
+    for i, e in enumerate(entries):
+        if e is not None:
+            res[i] = e
+    return res
+
+
+def step_pid_stats(data):
+    pids = data.all_pids
+    count = len(pids)
+    if count == 0:
+        return dict(min=None, max=None, count=0)
+    return dict(min=int(pids.min()), max=int(pids.max()), count=count)
+
+
+def get_step_index(fs, index_dir, files, collect):
+    """entry "steps" of the index in index_dir for the scan's json file described by the FileStatus fs if it and the step files are unchanged, otherwise collect()"""
+    signatures = step_signatures(files)
+    content = load_meta_index(fs, index_dir, "steps")
+    if content is None or content["files"] != signatures:
+        content = dict(files=signatures, steps=collect())
+        update_meta_index(fs, index_dir, content, "steps")
+    return content["steps"]
+
+
+def step_signatures(files):
+    """signatures (see FileStatus) of the files of each step, None for missing files"""
+    return [[step_signature(fn) for fn in fns] for fns in files]
+
+
+def step_signature(fname):
+    try:
+        return list(FileStatus(fname).signature) # json stores tuples as lists
+    except OSError:
+        return None
+
+
+def find_steps(index, pids):
+    """
+    Look up the steps for pids via searchsorted in the sorted pid ranges of the steps in index (see pid_index).
+    If the pid ranges of several steps overlap, pids in the overlap are assigned to the step with the latest start and a warning is issued.
+    """
+    pids = np.asanyarray(pids)
+    steps = [i for i, s in enumerate(index) if s is not None and s["count"] > 0]
+    starts = np.array([index[i]["min"] for i in steps], dtype=np.int64)
+    stops  = np.array([index[i]["max"] for i in steps], dtype=np.int64)
+    steps  = np.array(steps, dtype=int)
+
+    order = np.argsort(starts, kind="stable")
+    starts, stops, steps = starts[order], stops[order], steps[order]
+
+    res = np.full(pids.shape, -1, dtype=int)
+    if len(steps) == 0:
+        return res
+
+    pos = np.searchsorted(starts, pids, side="right") - 1 # last step starting at or before each pid
+    clipped = np.maximum(pos, 0)
+    found = (pos >= 0) & (pids <= stops[clipped])
+
+    max_stops = np.maximum.accumulate(stops) # furthest reach of all steps starting at or before each step
+    nested = ~found & (pos >= 0) & (pids <= max_stops[clipped]) # only within the range of an earlier step
+    for j in reversed(range(len(steps))): # only needed for overlapping ranges
+        if not nested.any():
+            break
+        within = nested & (starts[j] <= pids) & (pids <= stops[j])
+        clipped[within] = j
+        found |= within
+        nested &= ~within
+
+    res[found] = steps[clipped[found]]
+
+    previous = np.maximum(clipped - 1, 0)
+    ambiguous = found & (clipped >= 1) & (pids <= max_stops[previous]) # also within the range of an earlier step
+    if ambiguous.any():
+        namb = np.count_nonzero(ambiguous)
+        warn(f"{namb} pid(s) are within the overlapping pid ranges of several steps and are assigned to the step with the latest start", stacklevel=3)
+
+    return res
+
+
+def select_valid(data, pids):
+    """set the valid marker of each channel of data to the entries of pids"""
+    for chan in data.values():
+        chan.reset_valid()
+        chan.valid = np.nonzero(np.isin(chan.pids, pids))[0]
+
+
+def open_step(fns, channels=None, **kwargs):
+    """
+    Open the files of a step and read the given channels,
+    returns the file names, the SFDataFiles object and the exception that occurred while opening (if any)
+    """
+    try:
+        data = SFDataFiles(*fns, **kwargs)
+    except Exception as exc:
+        return fns, None, exc
+
+    for name in channels or ():
+        try:
+            ch = data[name]
+            ch.pids, ch.data # reading fills the cache
+        except Exception: # errors show up again when the channel is accessed
+            pass
+
+    return fns, data, None
+
+
+def close_step(step):
+    _fns, data, _exc = step
+    if data is not None:
+        data.close()
+
+
 
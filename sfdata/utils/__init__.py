@@ -1,14 +1,21 @@
 
 from .utils import typename
 from .batching import apply_batched, batched
+from .cache import make_cache
 from .closedh5 import ClosedH5
+from .concat import ConcatDataset
+from .directchunk import wrap_direct_chunks
+from .da import dask_read_valid
 from .cprint import cprint, ncprint
 from .filecontext import FileContext
 from .filestatus import FileStatus
-from .h5 import h5_boolean_indexing
+from .h5 import h5_boolean_indexing, h5_read_valid
 from .json import json_load
+from .mmap import mmap_dataset, mmap_read_valid
 from .np import adjust_shape
-from .pd import decide_pandas_dtype
+from .parallel import parallel_map, prefetched
+from .pd import decide_pandas_dtype, make_wide_dataframe, make_filled_column
+from .pids import intersect_pids, union_pids, shared_indices, pid_range_counts
 from .progress import dip, percentage_missing, decide_color
 from .strprint import strlen, maxstrlen, print_line, printable_string_sequence, enquote
 from .warn import print_skip_warning
@@ -1,38 +1,183 @@
+from functools import partial
+import h5py
 import numpy as np
-from .np import adjust_shape, nothing_like
+from .rowreader import RowReader
+from .h5 import h5_read_runs, use_full_read
+from .np import adjust_shape, nothing_like, contiguous_runs, is_strictly_increasing
+from .parallel import parallel_map
 
 
-def apply_batched(func, dataset, indices, batch_size, nbatches=None):
+AUTO_BATCH_NBYTES = 512 * 1024**2 # default memory budget per batch for batch_size="auto"
+
+
+def apply_batched(func, dataset, indices, batch_size, nbatches=None, out=None, dtype=None, workers=None, executor="thread", max_bytes=None):
     """
-    Iterate over dataset[indices] in batches of batch_size length
+    Iterate over dataset[indices] in batches of batch_size length (or chunk-aligned batches for batch_size="auto", see chunk_batch_slices)
     and apply func to each batch collecting the results in a numpy array
     limit the result to nbatches batches, the default nbatches=None means all batches
+    the result array takes the dtype of the first batch result unless dtype is given,
+    alternatively, the results can be written into a preallocated array out
+    if the results per entry differ in shape, an object array with one result per entry is returned
+    with workers, the batches are read and processed in a pool of threads or processes (see map_batches)
     """
-    if batch_size == 0 or nbatches == 0:
+    slices = list(get_batch_slices(dataset, indices, batch_size, nbatches=nbatches, max_bytes=max_bytes))
+
+    if not slices:
+        if out is not None:
+            return out[:0]
+        if dtype is not None:
+            return np.empty(0, dtype=dtype)
         return nothing_like(dataset)
 
-    batches = batched(dataset, indices, batch_size, nbatches=nbatches)
-    first_indices, first_batch = next(batches)
-    first_batch_res = func(first_batch)
+    results = map_batches(func, dataset, slices, workers=workers, executor=executor)
+    first_indices, first_batch_res = next(results)
+    first_batch_res = as_batch_result(first_batch_res)
 
-    ntotal = len(indices)
-    if nbatches is not None:
-        ntotal_batched = nbatches * batch_size
-        ntotal = min(ntotal, ntotal_batched)
+    last_indices, _ = slices[-1]
+    ntotal = min(len(indices), last_indices.stop) # the last fixed-size slice may extend beyond the end
 
-    single_res_shape = first_batch_res[0].shape
+    single_res_shape = first_batch_res.shape[1:]
     res_shape = (ntotal, *single_res_shape)
-    res = np.empty(res_shape)
 
-    res[first_indices] = first_batch_res
-    for indices, batch in batches:
-        res[indices] = func(batch)
+    keep_dtype = (out is not None or dtype is not None)
+    allow_ragged = (out is None)
+
+    if out is not None:
+        if out.shape != res_shape:
+            raise ValueError(f"out has shape {out.shape} but the result has shape {res_shape}")
+        res = out
+    elif first_batch_res.dtype == object:
+        res = np.empty(ntotal, dtype=object)
+    else:
+        if dtype is None:
+            dtype = first_batch_res.dtype
+        res = np.empty(res_shape, dtype=dtype)
+
+    res = store_batch_result(res, first_indices, first_batch_res, keep_dtype, allow_ragged)
+    for indices, batch_res in results:
+        batch_res = as_batch_result(batch_res)
+        res = store_batch_result(res, indices, batch_res, keep_dtype, allow_ragged)
+    return res
+
+
+def map_batches(func, dataset, slices, workers=None, executor="thread"):
+    """
+    Iterate over the index slices of the batches of dataset[indices] and the results of func applied to the batches,
+    which are given as slices, i.e., pairs of index slices and the corresponding indices (see get_batch_slices)
+    workers=None or workers=1 runs serially, otherwise the batches are read and processed in a pool of workers:
+    - executor="thread" shares the open dataset, which works best if func releases the GIL (as most numpy functions do)
+    - executor="process" opens the file again in each process by file and dataset name, i.e., only indices and results are pickled
+    results are yielded in the order of the batches
+    """
+    if workers is None or workers <= 1:
+        for index_slice, batch_indices in slices:
+            yield index_slice, func(read_batch(dataset, batch_indices))
+        return
+
+    if executor == "thread":
+        read_and_apply = partial(apply_to_batch, func, dataset)
+    elif executor == "process":
+        read_and_apply = partial(apply_to_file_batch, func, dataset.file.filename, dataset.name)
+    else:
+        raise ValueError(f"executor must be \"thread\" or \"process\", got: {executor!r}")
+
+    index_slices  = [i for i, _ in slices]
+    batch_indices = [b for _, b in slices]
+    results = parallel_map(read_and_apply, batch_indices, workers=workers, executor=executor)
+    yield from zip(index_slices, results)
+
+
+def apply_to_batch(func, dataset, batch_indices):
+    return func(read_batch(dataset, batch_indices))
+
+
+def apply_to_file_batch(func, fname, dataset_name, batch_indices):
+    dataset = open_worker_file(fname)[dataset_name]
+    return apply_to_batch(func, dataset, batch_indices)
+
+
+_worker_files = {}
+
+def open_worker_file(fname):
+    """open fname once per (worker) process and keep it open for further batches"""
+    f = _worker_files.get(fname)
+    if f is None:
+        f = _worker_files[fname] = h5py.File(fname, "r")
+    return f
+
+
+def as_batch_result(batch_res):
+    """convert batch_res to an array, which has dtype object with one entry per result if the results differ in shape"""
+    try:
+        return np.asanyarray(batch_res)
+    except ValueError: # ragged results
+        return as_object_array(batch_res)
+
+
+def store_batch_result(res, indices, batch_res, keep_dtype, allow_ragged):
+    """
+    store batch_res at res[indices] and return res
+    res is replaced by an object array if batch_res does not fit its shape (only if allow_ragged),
+    and (unless keep_dtype) promoted if batch_res does not fit its dtype
+    """
+    if res.dtype == object and res.ndim == 1:
+        if batch_res.dtype != object or batch_res.ndim > 1:
+            batch_res = as_object_array(batch_res)
+        res[indices] = batch_res
+        return res
+
+    if batch_res.dtype == object or batch_res.shape[1:] != res.shape[1:]:
+        if not allow_ragged:
+            raise ValueError(f"result of shape {batch_res.shape[1:]} per entry does not fit into shape {res.shape[1:]}")
+        nfilled = indices.start # batches are stored in order
+        res = as_object_array(res[:nfilled], length=len(res))
+        return store_batch_result(res, indices, batch_res, keep_dtype, allow_ragged)
+
+    if not keep_dtype and not np.can_cast(batch_res.dtype, res.dtype, casting="safe"):
+        res = res.astype(np.result_type(res, batch_res))
+
+    res[indices] = batch_res
     return res
 
 
-def batched(dataset, indices, batch_size, nbatches=None):
+def as_object_array(entries, length=None):
+    """1D object array with one entry per element of entries, padded with None to length"""
+    if length is None:
+        length = len(entries)
+    res = np.empty(length, dtype=object)
+    for i, entry in enumerate(entries): # assigning element-wise stores the entries instead of broadcasting them
+        res[i] = entry
+    return res
+
+
+def batched(dataset, indices, batch_size, nbatches=None, max_bytes=None, reuse_buffer=False):
     """
-    Iterate over dataset[indices] in batches of batch_size length
+    Iterate over dataset[indices] in batches of batch_size length (or chunk-aligned batches for batch_size="auto", see chunk_batch_slices)
+    limit the result to nbatches batches, the default nbatches=None means all batches
+    with reuse_buffer, all batches are read into the same array (if possible), i.e., each batch is overwritten by the next one
+    """
+    buffers = BatchBuffers(dataset) if reuse_buffer else None
+    slices = get_batch_slices(dataset, indices, batch_size, nbatches=nbatches, max_bytes=max_bytes)
+    for index_slice, batch_indices in slices:
+        batch_data = read_batch(dataset, batch_indices, buffers=buffers)
+        yield index_slice, batch_data
+
+
+def get_batch_slices(dataset, indices, batch_size, nbatches=None, max_bytes=None):
+    """
+    Iterate over the index slices of the batches and the corresponding indices
+    for batch_size="auto" the batches are aligned to the chunks of dataset and limited to max_bytes, otherwise they have fixed size
+    """
+    if batch_size == "auto":
+        if max_bytes is None:
+            max_bytes = AUTO_BATCH_NBYTES
+        return chunk_batch_slices(dataset, indices, max_bytes, nbatches=nbatches)
+    return batch_slices(indices, batch_size, nbatches=nbatches)
+
+
+def batch_slices(indices, batch_size, nbatches=None):
+    """
+    Iterate over the index slices of the batches and the corresponding indices
     limit the result to nbatches batches, the default nbatches=None means all batches
     """
     if batch_size == 0 or nbatches == 0:
@@ -41,24 +186,116 @@ def batched(dataset, indices, batch_size, nbatches=None):
     ntotal = len(indices)
     batch_size = min(batch_size, ntotal)
 
-    indices = np.asanyarray(indices) # see indices_in_batch below
+    indices = np.asanyarray(indices) # see indices_in_batch in read_batch
     for i in range(0, ntotal, batch_size):
         if nbatches is not None and i >= nbatches * batch_size:
             break
 
         index_slice = slice(i, i+batch_size)
         batch_indices = indices[index_slice]
+        yield index_slice, batch_indices
+
+
+def chunk_batch_slices(dataset, indices, max_bytes, nbatches=None):
+    """
+    Iterate over the index slices of the batches and the corresponding indices
+    with each batch containing the indices within a whole number of chunks (along the first axis) of dataset:
+    - the span of the rows of each batch fits into max_bytes (but is at least one chunk)
+    - each chunk belongs to exactly one batch, i.e., it is read (and decompressed) exactly once per pass
+    - batches without indices are skipped, thus the number of indices per batch varies
+    """
+    if nbatches == 0 or len(indices) == 0:
+        return
+
+    indices = np.asanyarray(indices)
+    nrows = auto_batch_rows(dataset, max_bytes)
+
+    first = indices[0]  // nrows
+    last  = indices[-1] // nrows
+    edges = np.arange(first + 1, last + 1) * nrows # batch boundaries in the rows of dataset
+    bounds = np.searchsorted(indices, edges) # this assumes indices is sorted
+
+    starts = np.r_[0, bounds]
+    stops  = np.r_[bounds, len(indices)]
+    nonempty = (stops > starts)
+    starts = starts[nonempty]
+    stops  = stops[nonempty]
+
+    if nbatches is not None:
+        starts = starts[:nbatches]
+        stops  = stops[:nbatches]
+
+    for start, stop in zip(starts, stops):
+        index_slice = slice(int(start), int(stop))
+        batch_indices = indices[index_slice]
+        yield index_slice, batch_indices
 
-        # this assumes indices is sorted (otherwise min/max)
-        start = batch_indices[0]
-        stop  = batch_indices[-1] + 1
 
-        slice_batch = slice(start, stop)
-        indices_in_batch = batch_indices - start # indices has to be numpy array for this to work
+def auto_batch_rows(dataset, max_bytes):
+    """number of rows of dataset that consist of whole chunks and fit into max_bytes (but at least one chunk)"""
+    row_nbytes = dataset.dtype.itemsize * int(np.prod(dataset.shape[1:]))
+    row_nbytes = max(row_nbytes, 1)
+    chunks = getattr(dataset, "chunks", None) # None for contiguous datasets or non-h5py datasets
+    chunk_rows = chunks[0] if chunks else 1
+    chunk_nbytes = chunk_rows * row_nbytes
+    nchunks = max(max_bytes // chunk_nbytes, 1)
+    return nchunks * chunk_rows
 
+
+def read_batch(dataset, batch_indices, buffers=None):
+    """
+    read dataset[batch_indices], depending on the density of batch_indices within their span either
+    via the slice spanning all batch_indices or via the contiguous runs of batch_indices (see h5_read_valid)
+    buffers (see BatchBuffers) allows to read into reusable arrays instead of allocating new ones
+    """
+    # this assumes indices is sorted (otherwise min/max)
+    start = batch_indices[0]
+    stop  = batch_indices[-1] + 1
+
+    slice_batch = slice(start, stop)
+    indices_in_batch = batch_indices - start # indices has to be numpy array for this to work
+
+    if isinstance(dataset, RowReader):
+        out = buffers.get("batch", len(batch_indices)) if buffers else None
+        batch_data = dataset.read_rows(batch_indices, out=out)
+        return adjust_shape(batch_data)
+
+    if not isinstance(dataset, h5py.Dataset) or dataset.dtype.kind == "O" or not is_strictly_increasing(batch_indices):
         batch_data = dataset[slice_batch][indices_in_batch]
-        batch_data = adjust_shape(batch_data)
-        yield index_slice, batch_data
+        return adjust_shape(batch_data)
+
+    nvalid = len(batch_indices)
+    starts, stops = contiguous_runs(batch_indices)
+
+    if not use_full_read(dataset, nvalid, len(starts), ntotal=stop-start):
+        out = buffers.get("batch", nvalid) if buffers else None
+        batch_data = h5_read_runs(dataset, starts, stops, out=out)
+    elif buffers:
+        span = h5_read_runs(dataset, [start], [stop], out=buffers.get("span", stop-start))
+        batch_data = np.take(span, indices_in_batch, axis=0, out=buffers.get("batch", nvalid))
+    else:
+        batch_data = dataset[slice_batch][indices_in_batch]
+
+    return adjust_shape(batch_data)
+
+
+
+class BatchBuffers:
+    """
+    Reusable arrays with the row shape and dtype of dataset for reading batches,
+    which are only reallocated if a larger batch is requested
+    """
+
+    def __init__(self, dataset):
+        self.row_shape = dataset.shape[1:]
+        self.dtype = dataset.dtype
+        self.arrays = {}
+
+    def get(self, name, nrows):
+        arr = self.arrays.get(name)
+        if arr is None or len(arr) < nrows:
+            arr = self.arrays[name] = np.empty((nrows, *self.row_shape), dtype=self.dtype)
+        return arr[:nrows]
 
 
 
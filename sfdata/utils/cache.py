@@ -0,0 +1,119 @@
+from collections import OrderedDict
+from threading import Lock
+
+from .utils import typename
+
+
+CACHEABLE = ("pids", "data", "timestamps")
+DEFAULT_CACHE_NBYTES = 1024**3 # 1 GB
+
+
+class LRUCache:
+    """
+    Least-recently-used cache for numpy arrays with a budget for the total number of bytes:
+    - storing an array evicts the least recently used arrays until the new one fits
+    - arrays larger than the whole budget are not stored at all
+    """
+
+    def __init__(self, max_nbytes=DEFAULT_CACHE_NBYTES):
+        self.max_nbytes = max_nbytes
+        self.nbytes = 0
+        self.entries = OrderedDict()
+        self.lock = Lock()
+
+    def get(self, key, default=None):
+        with self.lock:
+            try:
+                value = self.entries[key]
+            except KeyError:
+                return default
+            self.entries.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        nbytes = value.nbytes
+        with self.lock:
+            self._pop(key)
+            if nbytes > self.max_nbytes:
+                return
+            while self.nbytes + nbytes > self.max_nbytes:
+                _key, evicted = self.entries.popitem(last=False)
+                self.nbytes -= evicted.nbytes
+            self.entries[key] = value
+            self.nbytes += nbytes
+
+    def pop(self, key):
+        with self.lock:
+            return self._pop(key)
+
+    def _pop(self, key):
+        value = self.entries.pop(key, None)
+        if value is not None:
+            self.nbytes -= value.nbytes
+        return value
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.nbytes = 0
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __repr__(self):
+        tn = typename(self)
+        return f"{tn}: {len(self)} entries, {self.nbytes} / {self.max_nbytes} bytes"
+
+
+
+class ChannelCache(LRUCache):
+    """
+    LRUCache for the raw (i.e., before applying valid) arrays of channels,
+    which caches only the datasets listed in which (any of: pids, data, timestamps)
+    """
+
+    def __init__(self, which=CACHEABLE, max_nbytes=DEFAULT_CACHE_NBYTES):
+        super().__init__(max_nbytes)
+        self.which = frozenset(which)
+
+    def invalidate(self, fname, name):
+        for which in CACHEABLE:
+            self.pop((fname, name, which))
+
+
+
+def make_cache(which=None, max_nbytes=None):
+    """
+    Create a ChannelCache from the user-facing arguments:
+    - which can be None/False (no cache), True (cache all), a single dataset name or a sequence of names
+    - giving only max_nbytes enables caching all datasets
+    - an existing ChannelCache is passed through, which allows to share it between several files
+    """
+    if isinstance(which, ChannelCache):
+        return which
+
+    if which is None or which is False:
+        if max_nbytes is None:
+            return None
+        which = True
+
+    if which is True:
+        which = CACHEABLE
+    elif isinstance(which, str):
+        which = (which,)
+
+    unknown = set(which) - set(CACHEABLE)
+    if unknown:
+        unknown = sorted(unknown)
+        raise ValueError(f"cannot cache {unknown}, can only cache: {CACHEABLE}")
+
+    if max_nbytes is None:
+        max_nbytes = DEFAULT_CACHE_NBYTES
+
+    return ChannelCache(which, max_nbytes)
+
+
+
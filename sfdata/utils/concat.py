@@ -0,0 +1,73 @@
+import numpy as np
+
+from .h5 import h5_read_valid
+from .rowreader import RowReader
+
+
+class ConcatDataset(RowReader):
+    """
+    Read-only concatenation of several datasets (or arrays) along the first axis without copying them:
+    - the rows are routed to the parts via the boundaries of the parts' rows
+    - each part only reads its own rows (see h5_read_valid) into the corresponding positions of one preallocated array
+    Indexing works as for RowReader.
+    All parts need to have the same dtype and the same shape apart from the first axis.
+    """
+
+    def __init__(self, parts, name=None):
+        check_compatible_parts(parts, name)
+        self.parts = parts
+        self.name = name
+        lengths = [p.shape[0] for p in parts]
+        self.bounds = np.cumsum([0, *lengths])
+        self.dtype = parts[0].dtype
+        self.shape = (int(self.bounds[-1]), *parts[0].shape[1:])
+
+    @property
+    def ndim(self):
+        return len(self.shape)
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __repr__(self):
+        return f"ConcatDataset({self.parts!r})"
+
+
+    def read_rows(self, rows, out=None):
+        """
+        Read the given rows (any order, duplicates allowed) into out (or a new array),
+        reading from each involved part exactly once
+        """
+        rows = np.asanyarray(rows, dtype=int)
+        nrows = len(rows)
+
+        if out is None:
+            shape = (nrows, *self.shape[1:])
+            out = np.empty(shape, dtype=self.dtype)
+
+        if nrows == 0:
+            return out
+
+        part_ids = np.searchsorted(self.bounds, rows, side="right") - 1 # empty parts share their boundary with the next part
+        order = np.argsort(part_ids, kind="stable")
+        unique_ids, bounds = np.unique(part_ids[order], return_index=True)
+        bounds = np.r_[bounds, nrows]
+
+        for pid, start, stop in zip(unique_ids, bounds[:-1], bounds[1:]):
+            positions = order[start:stop]
+            local = rows[positions] - self.bounds[pid]
+            out[positions] = h5_read_valid(self.parts[pid], local)
+
+        return out
+
+
+def check_compatible_parts(parts, name):
+    first = parts[0]
+    for p in parts[1:]:
+        if p.dtype != first.dtype:
+            raise ValueError(f"cannot concatenate \"{name}\" with different dtypes: {first.dtype} vs. {p.dtype}")
+        if p.shape[1:] != first.shape[1:]:
+            raise ValueError(f"cannot concatenate \"{name}\" with different shapes per entry: {first.shape[1:]} vs. {p.shape[1:]}")
+
+
+
@@ -0,0 +1,27 @@
+from .h5 import as_index_array
+
+
+def dask_read_valid(ds, valid):
+    """
+    Lazy equivalent of h5_read_valid: wrap ds as chunked dask array and apply valid along the first axis.
+    The first axis is split into multiples of the HDF5 chunks (via dask's "auto" chunking, which respects ds.chunks),
+    all other axes are kept in one piece, i.e., images are never split across dask chunks.
+    Nothing is read until the result is computed, which needs the file to still be open.
+    """
+    import dask.array as da # dask is only needed for lazy access
+
+    chunks = {i: -1 for i in range(1, ds.ndim)}
+    chunks[0] = "auto"
+    arr = da.from_array(ds, chunks=chunks, name=False, lock=True) # h5py is not thread safe
+
+    if valid is not Ellipsis:
+        indices = as_index_array(valid)
+        arr = arr[indices]
+
+    if arr.ndim == 2 and arr.shape[1] == 1: # same as adjust_shape
+        arr = arr.reshape(-1)
+
+    return arr
+
+
+
@@ -0,0 +1,132 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import h5py
+import numpy as np
+import bitshuffle
+import bitshuffle.h5
+
+from .rowreader import RowReader
+
+
+HEADER_NBYTES = 12 # bitshuffle chunk header: uncompressed size (uint64) and block size in bytes (uint32), both big-endian
+FILTER_SKIPPED = 1 # bit in the filter mask of a chunk that is set if the (only) filter was not applied
+
+
+def wrap_direct_chunks(ds, workers):
+    """
+    Wrap ds as DirectChunkDataset if workers is given and ds supports direct chunk reads, otherwise return ds unchanged
+    """
+    if not workers or not supports_direct_chunks(ds):
+        return ds
+    return DirectChunkDataset(ds, workers)
+
+
+def supports_direct_chunks(ds):
+    """
+    Check whether ds is bitshuffle/LZ4 compressed (and nothing else)
+    with chunks that contain whole rows, i.e., each chunk can be decompressed into complete rows
+    """
+    if not isinstance(ds, h5py.Dataset) or ds.chunks is None or ds.dtype.hasobject:
+        return False
+
+    if ds.chunks[1:] != ds.shape[1:]:
+        return False
+
+    plist = ds.id.get_create_plist()
+    if plist.get_nfilters() != 1:
+        return False
+
+    code, _flags, cd_values, _name = plist.get_filter(0)
+    if code != bitshuffle.h5.H5FILTER:
+        return False
+
+    # cd_values: reserved, version, element size, block size, compression
+    return len(cd_values) >= 5 and cd_values[4] == bitshuffle.h5.H5_COMPRESS_LZ4
+
+
+
+class DirectChunkDataset(RowReader):
+    """
+    Read-only wrapper for a bitshuffle/LZ4 compressed h5py dataset:
+    - the raw chunks are read via read_direct_chunk, i.e., bypassing the HDF5 filter pipeline
+    - the chunks are decompressed with the bitshuffle library in a pool of workers threads
+    - rows are assigned into a preallocated array
+    Indexing works as for RowReader.
+    All other attributes are forwarded to the wrapped dataset.
+    """
+
+    def __init__(self, dataset, workers):
+        self.dataset = dataset
+        self.workers = workers
+        self.chunk_rows = dataset.chunks[0]
+
+    def __getattr__(self, name):
+        return getattr(self.dataset, name)
+
+    def __len__(self):
+        return len(self.dataset)
+
+    def __repr__(self):
+        return f"DirectChunkDataset({self.dataset!r}, workers={self.workers})"
+
+
+    def read_rows(self, rows, out=None):
+        """
+        Read the given rows (any order, duplicates allowed) into out (or a new array),
+        reading and decompressing each involved chunk exactly once
+        """
+        rows = np.asanyarray(rows, dtype=int)
+        nrows = len(rows)
+
+        if out is None:
+            shape = (nrows, *self.dataset.shape[1:])
+            out = np.empty(shape, dtype=self.dataset.dtype)
+
+        if nrows == 0:
+            return out
+
+        chunk_ids = rows // self.chunk_rows
+        order = np.argsort(chunk_ids, kind="stable")
+        unique_ids, bounds = np.unique(chunk_ids[order], return_index=True)
+        bounds = np.r_[bounds, nrows]
+
+        def assign(cid, filter_mask, raw, positions):
+            chunk = self.decompress(filter_mask, raw)
+            out[positions] = chunk[rows[positions] - cid * self.chunk_rows]
+
+        tasks = (
+            (cid, order[start:stop])
+            for cid, start, stop in zip(unique_ids, bounds[:-1], bounds[1:])
+        )
+
+        if len(unique_ids) == 1 or self.workers <= 1:
+            for cid, positions in tasks:
+                assign(cid, *self.read_chunk(cid), positions)
+            return out
+
+        with ThreadPoolExecutor(self.workers) as pool:
+            futures = [pool.submit(assign, cid, *self.read_chunk(cid), positions) for cid, positions in tasks] # reading stays in this thread, decompressing overlaps with it
+            for f in futures:
+                f.result()
+
+        return out
+
+
+    def read_chunk(self, cid):
+        offsets = (int(cid) * self.chunk_rows,) + (0,) * (self.dataset.ndim - 1)
+        return self.dataset.id.read_direct_chunk(offsets)
+
+    def decompress(self, filter_mask, raw):
+        dtype = self.dataset.dtype
+        shape = self.dataset.chunks
+
+        if filter_mask & FILTER_SKIPPED:
+            return np.frombuffer(raw, dtype=dtype).reshape(shape)
+
+        block_nbytes = int.from_bytes(raw[8:HEADER_NBYTES], "big")
+        block_size = block_nbytes // dtype.itemsize
+        compressed = np.frombuffer(raw, dtype=np.uint8, offset=HEADER_NBYTES)
+        return bitshuffle.decompress_lz4(compressed, shape, dtype, block_size)
+
+
+
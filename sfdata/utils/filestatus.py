@@ -51,6 +51,12 @@ class FileStatus:
         """File size in bytes."""
         return self._stat().st_size
 
+    @property
+    def signature(self):
+        """Absolute path, size in bytes and modification time in nanoseconds, which change if the file is replaced or modified."""
+        st = self._stat()
+        return (str(self.path.resolve()), st.st_size, st.st_mtime_ns)
+
     def _stat(self):
         return os.stat(self.name)
 
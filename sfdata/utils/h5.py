@@ -1,5 +1,19 @@
+import h5py
 import numpy as np
 
+from .rowreader import RowReader
+from .np import contiguous_runs, is_strictly_increasing
+
+
+MAX_SELECTIVITY = 0.5 # above this fraction of valid rows, reading everything and masking is cheaper
+MIN_SELECTIVE_NBYTES = 1024**2 # datasets smaller than this are always read completely
+RUN_OVERHEAD_NBYTES = 4 * 1024 # estimated cost of each additional hyperslab, expressed in bytes read
+
+RDCC_KWARGS = ("rdcc_nbytes", "rdcc_nslots", "rdcc_w0") # chunk cache arguments of h5py.File
+AUTO_RDCC_CHUNK_ROWS = 2 # the automatic chunk cache holds this many rows of chunks along the first axis
+AUTO_RDCC_MAX_NBYTES = 256 * 1024**2 # never make the automatic chunk cache larger than this
+AUTO_RDCC_SLOTS_PER_CHUNK = 100 # recommended by the HDF5 documentation
+
 
 def h5_boolean_indexing(ds, indices):
     """
@@ -17,4 +31,140 @@ def h5_boolean_indexing(ds, indices):
     return ds[coords]
 
 
+def h5_read_valid(ds, valid):
+    """
+    Read ds[valid] along the first axis.
+    Depending on the selectivity of valid and the size of the rows, either
+    the full dataset is read and valid is applied afterwards (cheap for dense selections),
+    or only the contiguous runs of valid rows are read into a preallocated array
+    (memory and I/O scale with the number of valid rows instead of the total number of rows).
+    """
+    if valid is Ellipsis:
+        return ds[:]
+
+    if isinstance(ds, RowReader): # reads only what contains valid rows, e.g., the chunks for DirectChunkDataset
+        return ds.read_rows(as_index_array(valid))
+
+    if not isinstance(ds, h5py.Dataset):
+        return ds[:][valid]
+
+    indices = as_index_array(valid)
+    if not is_strictly_increasing(indices): # runs need sorted unique indices
+        return ds[:][indices]
+
+    starts, stops = contiguous_runs(indices)
+    if use_full_read(ds, len(indices), len(starts)):
+        return ds[:][indices]
+
+    return h5_read_runs(ds, starts, stops)
+
+
+def h5_read_runs(ds, starts, stops, out=None):
+    """
+    Read the rows [start, stop) for each pair of starts and stops from ds into out,
+    which needs to have the shape (sum(stops - starts), *ds.shape[1:]).
+    If out is None, a new array is allocated.
+    Each run is selected as hyperslab and read directly into the corresponding view of out,
+    which avoids both the temporary copies of h5py's slicing and the slow creation of large hyperslab unions.
+    """
+    starts = np.asanyarray(starts)
+    stops  = np.asanyarray(stops)
+    nrows = int((stops - starts).sum())
+
+    if out is None:
+        shape = (nrows, *ds.shape[1:])
+        out = np.empty(shape, dtype=ds.dtype)
+
+    if ds.dtype.kind == "O": # variable-length types cannot be read into a preallocated buffer
+        pos = 0
+        for start, stop in zip(starts, stops):
+            length = stop - start
+            out[pos:pos+length] = ds[start:stop]
+            pos += length
+        return out
+
+    file_space = ds.id.get_space()
+    zeros = (0,) * (ds.ndim - 1)
+    other_dims = ds.shape[1:]
+
+    pos = 0
+    for start, stop in zip(starts, stops):
+        length = int(stop - start)
+        file_space.select_hyperslab((int(start), *zeros), (length, *other_dims))
+        mem_space = h5py.h5s.create_simple((length, *other_dims))
+        ds.id.read(mem_space, file_space, out[pos:pos+length])
+        pos += length
+
+    return out
+
+
+def use_full_read(ds, nvalid, nruns, ntotal=None):
+    """
+    Decide whether reading the full dataset and masking is cheaper than reading nvalid rows in nruns runs
+    ntotal allows to restrict the decision to a span of ntotal rows instead of the full dataset
+    """
+    if ntotal is None:
+        ntotal = len(ds)
+    if ntotal == 0 or nvalid / ntotal >= MAX_SELECTIVITY:
+        return True
+
+    row_nbytes = ds.dtype.itemsize * int(np.prod(ds.shape[1:]))
+    full_nbytes = ntotal * row_nbytes
+    if full_nbytes <= MIN_SELECTIVE_NBYTES:
+        return True
+
+    selective_nbytes = nvalid * row_nbytes + nruns * RUN_OVERHEAD_NBYTES
+    return full_nbytes <= selective_nbytes
+
+
+def as_index_array(valid):
+    """convert a boolean mask or a sequence of indices into an array of indices"""
+    valid = np.asanyarray(valid)
+    if valid.dtype == bool:
+        return np.nonzero(valid)[0]
+    return valid.astype(int, copy=False)
+
+
+def auto_chunk_cache(ds):
+    """
+    Chunk cache settings (nslots, nbytes, w0) for the chunked dataset ds that are large enough for AUTO_RDCC_CHUNK_ROWS rows of chunks,
+    such that, e.g., repeated partial reads of an image do not decompress the whole chunk again for every read.
+    Returns None if the current chunk cache is already large enough (or ds is not a chunked h5py dataset).
+    """
+    if not isinstance(ds, h5py.Dataset) or ds.chunks is None:
+        return None
+
+    _nslots, current_nbytes, w0 = ds.id.get_access_plist().get_chunk_cache()
+
+    chunk_nbytes = ds.dtype.itemsize * int(np.prod(ds.chunks))
+    chunks_per_row = int(np.prod(np.ceil(np.divide(ds.shape[1:], ds.chunks[1:]))))
+    nbytes = chunk_nbytes * chunks_per_row * AUTO_RDCC_CHUNK_ROWS
+    nbytes = min(nbytes, AUTO_RDCC_MAX_NBYTES)
+    if nbytes <= current_nbytes:
+        return None
+
+    nchunks = -(-nbytes // chunk_nbytes) # ceil
+    nslots = next_prime(nchunks * AUTO_RDCC_SLOTS_PER_CHUNK)
+    return nslots, nbytes, w0
+
+
+def open_with_chunk_cache(group, name, nslots, nbytes, w0):
+    """
+    Open the dataset group[name] with the given chunk cache settings.
+    HDF5 shares the chunk cache between all open handles of a dataset, i.e., the settings only apply if no other handle is open.
+    """
+    dapl = h5py.h5p.create(h5py.h5p.DATASET_ACCESS)
+    dapl.set_chunk_cache(nslots, nbytes, w0)
+    dsid = h5py.h5d.open(group.id, name.encode(), dapl=dapl)
+    return h5py.Dataset(dsid)
+
+
+def next_prime(n):
+    """smallest prime >= n, the chunk cache works best with a prime number of slots"""
+    n = max(n, 2)
+    while any(n % i == 0 for i in range(2, int(n**0.5) + 1)):
+        n += 1
+    return n
+
+
 
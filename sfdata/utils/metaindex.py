@@ -0,0 +1,140 @@
+import hashlib
+import json
+import os
+from warnings import warn
+
+import h5py
+
+from .json import json_load
+from .np import is_strictly_increasing
+from .utils import typename
+
+
+META_INDEX_VERSION = 4 # increase if the stored metadata changes
+DEFAULT_META_INDEX_DIR = os.path.join(os.path.expanduser("~"), ".cache", "sfdata")
+
+
+def get_meta_index_dir(meta_index):
+    """meta_index=True uses the default directory, a string is used as directory, anything falsy disables the index"""
+    if not meta_index:
+        return None
+    if meta_index is True:
+        return DEFAULT_META_INDEX_DIR
+    return meta_index
+
+
+def get_meta(fs, index_dir, data):
+    """
+    Channel metadata of the group data in the file described by the FileStatus fs,
+    loaded from the index in index_dir if it is up to date, otherwise collected from data and stored in the index
+    """
+    return get_indexed(fs, index_dir, "channels", lambda: collect_meta(data))
+
+
+def get_indexed(fs, index_dir, key, collect):
+    """
+    Entry key of the index in index_dir for the file described by the FileStatus fs if it is up to date,
+    otherwise the result of collect(), which is then stored in the index
+    """
+    content = load_meta_index(fs, index_dir, key)
+    if content is not None:
+        return content
+
+    content = collect()
+    update_meta_index(fs, index_dir, content, key)
+    return content
+
+
+def update_meta_index(fs, index_dir, content, key="channels"):
+    """same as save_meta_index, but failing to write the index only issues a warning"""
+    try:
+        save_meta_index(fs, index_dir, content, key)
+    except OSError as exc:
+        warn(f"Could not save metadata index since it caused {typename(exc)}: {exc}", stacklevel=3)
+
+
+def load_meta_index(fs, index_dir, key="channels"):
+    """
+    Load the entry key (e.g., the channel metadata) of the index for the file described by the FileStatus fs from index_dir,
+    returns None if there is no index or if it is outdated, i.e., the file's path, size or modification time changed
+    """
+    fname = make_meta_index_fname(fs, index_dir)
+    try:
+        index = json_load(fname)
+    except (OSError, ValueError):
+        return None
+
+    if index.get("version") != META_INDEX_VERSION or index.get("signature") != list(fs.signature):
+        return None
+
+    return index.get(key)
+
+
+def save_meta_index(fs, index_dir, content, key="channels"):
+    """
+    Store content (e.g., the channel metadata) as entry key of the index for the file described by the FileStatus fs in index_dir,
+    the file is written under a temporary name and then renamed such that concurrent readers never see partial files
+    """
+    os.makedirs(index_dir, exist_ok=True)
+    fname = make_meta_index_fname(fs, index_dir)
+    index = {"version": META_INDEX_VERSION, "signature": list(fs.signature), key: content}
+    tmp = f"{fname}.{os.getpid()}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(index, f)
+    os.replace(tmp, fname)
+
+
+def make_meta_index_fname(fs, index_dir):
+    path = str(fs.path.resolve())
+    digest = hashlib.sha1(path.encode()).hexdigest()
+    return os.path.join(index_dir, f"{digest}.json")
+
+
+def collect_meta(data):
+    """
+    Collect the metadata of all channels in the group data, i.e., of the groups with data and pulse_id datasets:
+    shape, dtype and chunk layout of the data, number of entries, and presence of timestamps.
+    This opens the datasets, but does not read them. The pid statistics of each channel start out as None
+    and are added once the pids are read anyway (see make_pid_meta and SFData.print_stats).
+    """
+    channels = {}
+    for name in data:
+        if data.get(name, getclass=True) is not h5py.Group:
+            continue
+        group = data[name]
+        if group.get("data", getclass=True) is not h5py.Dataset or group.get("pulse_id", getclass=True) is not h5py.Dataset:
+            continue
+        channels[name] = make_channel_meta(group)
+    return channels
+
+
+def make_channel_meta(group):
+    ds = group["data"]
+    return dict(
+        shape = list(ds.shape),
+        dtype = ds.dtype.str,
+        chunks = list(ds.chunks) if ds.chunks else None,
+        ntotal = group["pulse_id"].shape[0],
+        timestamps = ("timestamp" in group),
+        pids = None
+    )
+
+
+def make_pid_meta(pids):
+    """pid min/max/count/sortedness"""
+    pids = pids.reshape(-1)
+    count = len(pids)
+    return dict(
+        min = int(pids.min()) if count else None,
+        max = int(pids.max()) if count else None,
+        count = count,
+        sorted = is_strictly_increasing(pids)
+    )
+
+
+def count_pid_meta(metas):
+    """number of channels in metas with pid statistics"""
+    return sum(meta["pids"] is not None for meta in metas.values())
+
+
+
@@ -0,0 +1,48 @@
+import h5py
+import numpy as np
+
+from .h5 import as_index_array
+from .np import contiguous_runs, is_strictly_increasing
+
+
+MMAP_DRIVERS = ("sec2", "stdio") # drivers for which file addresses are byte offsets into the file on disk
+
+
+def mmap_dataset(ds):
+    """
+    Memory-map ds if it is stored contiguously and unfiltered within the file (i.e., not chunked, compact or external)
+    return None if ds cannot be memory-mapped
+    """
+    if not isinstance(ds, h5py.Dataset) or ds.dtype.hasobject or ds.file.driver not in MMAP_DRIVERS:
+        return None
+
+    plist = ds.id.get_create_plist()
+    if plist.get_layout() != h5py.h5d.CONTIGUOUS or plist.get_external_count() > 0:
+        return None
+
+    offset = ds.id.get_offset()
+    if offset is None: # storage not allocated, e.g., empty datasets
+        return None
+
+    return np.memmap(ds.file.filename, dtype=ds.dtype, mode="r", offset=offset, shape=ds.shape)
+
+
+def mmap_read_valid(arr, valid):
+    """
+    Equivalent of h5_read_valid for memory-mapped arrays:
+    Ellipsis and contiguous indices result in (read-only) views without reading anything,
+    other indices copy only the selected rows
+    """
+    if valid is Ellipsis:
+        return arr
+
+    indices = as_index_array(valid)
+    if len(indices) > 0 and is_strictly_increasing(indices):
+        starts, stops = contiguous_runs(indices)
+        if len(starts) == 1:
+            return arr[starts[0]:stops[0]]
+
+    return arr[indices]
+
+
+
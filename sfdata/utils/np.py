@@ -14,3 +14,28 @@ def nothing_like(arr):
 
 
 
+
+
+def is_strictly_increasing(arr):
+    """check if arr is sorted and contains no duplicates"""
+    arr = np.asanyarray(arr)
+    return bool(np.all(arr[1:] > arr[:-1]))
+
+
+def contiguous_runs(indices):
+    """
+    split sorted indices into runs of consecutive integers
+    return the arrays of starts and (exclusive) stops of the runs
+    """
+    indices = np.asanyarray(indices)
+    if len(indices) == 0:
+        empty = np.empty(0, dtype=int)
+        return empty, empty
+
+    breaks = np.nonzero(np.diff(indices) != 1)[0] + 1
+    starts = indices[np.r_[0, breaks]]
+    stops  = indices[np.r_[breaks - 1, -1]] + 1
+    return starts, stops
+
+
+
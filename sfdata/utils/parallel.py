@@ -0,0 +1,117 @@
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from itertools import count
+from multiprocessing import get_context
+from queue import Queue, Full
+from threading import Thread, Event
+
+from .warn import WarningCollector
+
+
+def parallel_map(func, items, workers=None, executor="thread"):
+    """
+    Generator equivalent to map(func, items), but with func running in a pool of workers threads
+    - results are yielded in the order of items
+    - warnings issued in the workers are reissued in the calling thread just before the respective result is yielded
+    - exceptions raised in func propagate to the caller
+    workers=None or workers=1 runs serially without creating a pool
+    executor="process" uses a pool of processes instead, for which func and items need to be picklable
+    """
+    if workers is None or workers <= 1:
+        yield from map(func, items)
+        return
+
+    if executor == "process":
+        yield from process_map(func, items, workers)
+        return
+
+    with WarningCollector() as collector, ThreadPoolExecutor(workers) as pool:
+        futures = [pool.submit(collector.run, i, func, item) for i, item in enumerate(items)]
+        results = [f.result() for f in futures]
+
+    for i, res in enumerate(results):
+        collector.reissue(i)
+        yield res
+
+
+def process_map(func, items, workers):
+    context = get_context("spawn") # forked processes would inherit the state of the HDF5 library including open files
+    with ProcessPoolExecutor(workers, mp_context=context) as pool:
+        results = list(pool.map(func, items))
+    yield from results
+
+
+
+ITEM, ERROR, DONE = range(3)
+PUT_TIMEOUT = 0.1 # seconds between checks whether the consumer has stopped
+
+
+def prefetched(iterable, n=None, discard=None):
+    """
+    Generator equivalent to iter(iterable), but with the items produced in a background thread up to n items ahead
+    - items are yielded in order
+    - warnings issued while producing an item are reissued in the calling thread just before the respective item is yielded
+    - exceptions raised while producing propagate to the caller
+    - closing the generator (e.g., via break) stops the background thread
+    - discard is called for each item that was produced but not yielded anymore, e.g., to close files
+    n=None or n=0 iterates in the calling thread
+    """
+    if not n:
+        yield from iterable
+        return
+
+    queue = Queue(maxsize=n)
+    stop = Event()
+    end = object()
+
+    def put(entry):
+        while not stop.is_set():
+            try:
+                queue.put(entry, timeout=PUT_TIMEOUT)
+            except Full:
+                continue
+            return True
+        return False
+
+    def produce(collector):
+        iterator = iter(iterable)
+        try:
+            for i in count():
+                item = collector.run(i, next, iterator, end) # warnings are tagged with the index of the item
+                if item is end:
+                    break
+                if not put((ITEM, item)):
+                    if discard is not None:
+                        discard(item)
+                    return
+        except BaseException as exc:
+            put((ERROR, exc))
+        else:
+            put((DONE, None))
+        finally:
+            close = getattr(iterator, "close", None)
+            if close is not None:
+                close()
+
+    with WarningCollector() as collector:
+        thread = Thread(target=produce, args=(collector,), daemon=True)
+        thread.start()
+
+        try:
+            for i in count():
+                kind, value = queue.get()
+                collector.reissue(i)
+                if kind == DONE:
+                    return
+                if kind == ERROR:
+                    raise value
+                yield value
+        finally:
+            stop.set()
+            thread.join()
+            while discard is not None and not queue.empty():
+                kind, value = queue.get()
+                if kind == ITEM:
+                    discard(value)
+
+
+
@@ -30,4 +30,71 @@ def decide_pandas_dtype(arr):
     return object
 
 
+def make_wide_dataframe(name, index, data, as_nullable=False):
+    """
+    Create a DataFrame with two-level columns from data:
+    - nD data: each element of the trailing dimensions becomes a numeric column (name, i), flattened in C order
+    - 1D data: a single column (name, ""), which allows to access it as series via df[name]
+    The data is not copied if it is contiguous.
+    """
+    nrows = len(data)
+    if data.ndim == 1:
+        block = data.reshape(nrows, 1)
+        columns = pd.MultiIndex.from_product([[name], [""]])
+    else:
+        block = data.reshape(nrows, int(np.prod(data.shape[1:]))) # -1 is ambiguous for nrows == 0
+        ncols = block.shape[1]
+        columns = pd.MultiIndex.from_product([[name], range(ncols)])
+
+    dtype = decide_pandas_dtype(data.reshape(-1)) if as_nullable else None
+    return pd.DataFrame(block, index=index, columns=columns, dtype=dtype, copy=False)
+
+
+def make_filled_column(nrows, rows, data, as_lists=False, as_nullable=False):
+    """
+    Create a column of length nrows with data written to the positions rows.
+    All other entries are marked as missing.
+    With as_nullable, 1D data is written directly into typed arrays (float with NaN, or nullable with mask),
+    otherwise (and for nD data) an object array with NaN as missing marker is created.
+    """
+    if as_nullable and data.ndim == 1:
+        dtype = decide_pandas_dtype(data)
+        kind = data.dtype.kind
+
+        if kind == "f":
+            col = np.full(nrows, np.nan, dtype=data.dtype)
+            col[rows] = data
+            return col
+
+        if kind in "iub":
+            values = np.zeros(nrows, dtype=data.dtype)
+            mask = np.ones(nrows, dtype=bool)
+            values[rows] = data
+            mask[rows] = False
+            if kind == "b":
+                return pd.arrays.BooleanArray(values, mask)
+            return pd.arrays.IntegerArray(values, mask)
+
+        col = make_filled_column(nrows, rows, data)
+        return pd.Series(col, dtype=object).astype(dtype).array
+
+    col = np.full(nrows, np.nan, dtype=object) # object dtype makes sure NaN can be used as missing marker also for int/bool
+    fill_object_column(col, rows, data, as_lists=as_lists)
+    return col
+
+
+def fill_object_column(col, rows, data, as_lists=False):
+    """
+    Write data to the positions rows of the object array col.
+    nD entries are stored as arrays, or as nested lists with as_lists.
+    """
+    if data.ndim == 1:
+        col[rows] = data
+        return
+
+    entries = data.tolist() if as_lists else data
+    for r, entry in zip(rows, entries): # assigning element-wise stores the entries instead of broadcasting them
+        col[r] = entry
+
+
 
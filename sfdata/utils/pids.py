@@ -0,0 +1,193 @@
+from functools import reduce
+import numpy as np
+
+from .np import is_strictly_increasing
+
+
+BITMAP_MAX_DENSITY_FACTOR = 8 # use a bitmap only if the pid range is at most this many times the number of pids
+BITMAP_MAX_NBYTES = 256 * 1024**2 # never allocate larger bitmaps than this
+COUNTS_CHUNK_SIZE = 2**24 # length of the pid range covered at once by shared_indices
+
+
+def intersect_pids(arrays):
+    """
+    Intersection of several pid arrays, equivalent to reduce(np.intersect1d, arrays)
+    For sorted unique pid arrays (the DAQ norm), the intersection is calculated in a single pass,
+    either via a count array over the overlapping pid range or via searchsorted lookups.
+    Unsorted or duplicate pids, or integer dtypes without common integer dtype (e.g., uint64 and int64), fall back to reduce(np.intersect1d, arrays).
+    """
+    arrays = [np.asanyarray(a) for a in arrays]
+    if len(arrays) < 2 or not all_sorted_unique_ints(arrays) or not has_common_int_dtype(arrays):
+        return reduce(np.intersect1d, arrays)
+
+    dtype = np.result_type(*arrays)
+    if any(len(a) == 0 for a in arrays):
+        return np.empty(0, dtype=dtype)
+
+    start = int(max(a[0] for a in arrays))
+    stop  = int(min(a[-1] for a in arrays)) + 1
+    if start >= stop:
+        return np.empty(0, dtype=dtype)
+
+    arrays = [clip_sorted(a, start, stop) for a in arrays]
+
+    if use_bitmap(stop - start, arrays):
+        counts = np.zeros(stop - start, dtype=np.min_scalar_type(len(arrays)))
+        for a in arrays:
+            counts[a - start] += 1 # pids are unique, thus each position is incremented at most once per array
+        res = np.nonzero(counts == len(arrays))[0] + start
+        return res.astype(dtype, copy=False)
+
+    arrays = sorted(arrays, key=len)
+    res = arrays[0]
+    for a in arrays[1:]:
+        res = res[isin_sorted(res, a)]
+    return res.astype(dtype, copy=False)
+
+
+def union_pids(arrays):
+    """
+    Union of several pid arrays, equivalent to reduce(np.union1d, arrays)
+    For sorted unique pid arrays (the DAQ norm), the union is calculated in a single pass,
+    either via a presence bitmap over the full pid range or via a stable sort of the concatenated arrays,
+    which (being timsort) merges the presorted runs, i.e., performs a k-way merge.
+    Unsorted or duplicate pids, or integer dtypes without common integer dtype (e.g., uint64 and int64), fall back to reduce(np.union1d, arrays).
+    """
+    arrays = [np.asanyarray(a) for a in arrays]
+    if len(arrays) < 2 or not all_sorted_unique_ints(arrays) or not has_common_int_dtype(arrays):
+        return reduce(np.union1d, arrays)
+
+    dtype = np.result_type(*arrays)
+    arrays = [a for a in arrays if len(a) > 0]
+    if not arrays:
+        return np.empty(0, dtype=dtype)
+
+    start = int(min(a[0] for a in arrays))
+    stop  = int(max(a[-1] for a in arrays)) + 1
+
+    if use_bitmap(stop - start, arrays):
+        present = np.zeros(stop - start, dtype=bool)
+        for a in arrays:
+            present[a - start] = True
+        res = np.nonzero(present)[0] + start
+        return res.astype(dtype, copy=False)
+
+    merged = np.concatenate(arrays).astype(dtype, copy=False)
+    merged.sort(kind="stable")
+    keep = np.empty(len(merged), dtype=bool)
+    keep[0] = True
+    np.not_equal(merged[1:], merged[:-1], out=keep[1:])
+    return merged[keep]
+
+
+def shared_indices(arrays, chunk_size=COUNTS_CHUNK_SIZE):
+    """
+    For each pid array, calculate the indices of the pids that are contained in all arrays,
+    i.e., the valid indices that result from dropping missing pids.
+    For sorted unique pid arrays (the DAQ norm), a count array over the overlapping pid range
+    is filled from all arrays and then read back for all arrays in one vectorized pass each.
+    The pid range is processed in chunks of chunk_size, which bounds the memory consumption.
+    For sparse pid ranges, the indices are looked up via searchsorted instead.
+    Unsorted or duplicate pids fall back to np.intersect1d with return_indices.
+    """
+    arrays = [np.asanyarray(a) for a in arrays]
+    if not arrays:
+        return []
+
+    if not all_sorted_unique_ints(arrays):
+        shared = reduce(np.intersect1d, arrays)
+        return [np.intersect1d(a, shared, return_indices=True)[1] for a in arrays]
+
+    nothing = [np.empty(0, dtype=np.intp) for _ in arrays]
+    if any(len(a) == 0 for a in arrays):
+        return nothing
+
+    start = int(max(a[0] for a in arrays))
+    stop  = int(min(a[-1] for a in arrays)) + 1
+    if start >= stop:
+        return nothing
+
+    clipped = [clip_sorted(a, start, stop) for a in arrays]
+    if not use_bitmap(stop - start, clipped):
+        shared = intersect_pids(arrays)
+        return [np.searchsorted(a, shared) for a in arrays]
+
+    nchans = len(arrays)
+    count_dtype = np.min_scalar_type(nchans)
+    res = [[] for _ in arrays]
+    for chunk_start in range(start, stop, chunk_size):
+        chunk_stop = min(chunk_start + chunk_size, stop)
+        bounds = [np.searchsorted(a, (chunk_start, chunk_stop)) for a in arrays]
+
+        counts = np.zeros(chunk_stop - chunk_start, dtype=count_dtype)
+        for a, (i, j) in zip(arrays, bounds):
+            counts[a[i:j] - chunk_start] += 1
+
+        for r, a, (i, j) in zip(res, arrays, bounds):
+            is_shared = (counts[a[i:j] - chunk_start] == nchans)
+            r.append(np.nonzero(is_shared)[0] + i)
+
+    return [np.concatenate(r) for r in res]
+
+
+def pid_range_counts(ranges):
+    """
+    Numbers of shared pids and of all pids for channels whose pids are complete ranges [start, stop),
+    i.e., the lengths of the intersection and of the union of the ranges
+    """
+    ranges = list(ranges)
+    if not ranges:
+        return 0, 0
+
+    n_shared = min(stop for _, stop in ranges) - max(start for start, _ in ranges)
+    n_shared = max(n_shared, 0) # also covers empty ranges
+
+    n_all = 0
+    current_start = current_stop = None
+    for start, stop in sorted(r for r in ranges if r[1] > r[0]):
+        if current_stop is None or start > current_stop: # disjoint from the current merged range
+            if current_stop is not None:
+                n_all += current_stop - current_start
+            current_start, current_stop = start, stop
+        else:
+            current_stop = max(current_stop, stop)
+    if current_stop is not None:
+        n_all += current_stop - current_start
+
+    return n_shared, n_all
+
+
+def all_sorted_unique_ints(arrays):
+    return all(
+        np.issubdtype(a.dtype, np.integer) and is_strictly_increasing(a)
+        for a in arrays
+    )
+
+
+def has_common_int_dtype(arrays):
+    """mixing signed and unsigned integers can promote to float64, e.g., for uint64 and int64"""
+    return np.issubdtype(np.result_type(*arrays), np.integer)
+
+
+def use_bitmap(span, arrays):
+    npids = sum(len(a) for a in arrays)
+    return span <= BITMAP_MAX_DENSITY_FACTOR * npids and span <= BITMAP_MAX_NBYTES
+
+
+def clip_sorted(arr, start, stop):
+    """restrict the sorted arr to the values within [start, stop)"""
+    i = np.searchsorted(arr, start, side="left")
+    j = np.searchsorted(arr, stop,  side="left")
+    return arr[i:j]
+
+
+def isin_sorted(values, arr):
+    """boolean mask which of values are in the sorted arr"""
+    if len(arr) == 0:
+        return np.zeros(len(values), dtype=bool)
+    idx = np.searchsorted(arr, values)
+    idx = np.minimum(idx, len(arr) - 1)
+    return arr[idx] == values
+
+
+
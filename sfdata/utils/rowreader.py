@@ -0,0 +1,58 @@
+from abc import ABC, abstractmethod
+
+import numpy as np
+
+
+class RowReader(ABC):
+    """
+    Base class for read-only dataset wrappers that read rows via read_rows(rows, out=None):
+    indexing is supported for the first axis (int, slice, index array or boolean mask), further axes are applied afterwards.
+    Subclasses need to provide __len__ and read_rows.
+    """
+
+    def __getitem__(self, key):
+        if not isinstance(key, tuple):
+            key = (key,)
+
+        first, rest = key[0], key[1:]
+
+        if first is Ellipsis:
+            if rest:
+                return self[:][key] # Ellipsis within further axes is not worth handling here
+            first = slice(None)
+
+        is_scalar = False
+        if isinstance(first, slice):
+            rows = np.arange(len(self))[first]
+        elif np.ndim(first) == 0:
+            is_scalar = True
+            rows = [int(first) % len(self)] # allow negative rows like numpy
+        else:
+            rows = np.asanyarray(first)
+            if rows.dtype == bool:
+                rows = np.nonzero(rows)[0]
+
+        res = self.read_rows(rows)
+
+        if is_scalar:
+            res = res[0]
+            other_axes = rest
+        else:
+            other_axes = (slice(None), *rest)
+
+        if rest:
+            res = res[other_axes]
+
+        return res
+
+
+    @abstractmethod
+    def read_rows(self, rows, out=None):
+        """read the given rows into out (or a new array)"""
+
+    @abstractmethod
+    def __len__(self):
+        """number of rows"""
+
+
+
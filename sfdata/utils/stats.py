@@ -0,0 +1,91 @@
+import numpy as np
+
+
+REDUCTIONS = ("count", "sum", "mean", "var", "std", "min", "max", "hist")
+BLOCK_BYTES = 16 * 1024**2 # size of the float64 buffer for the centred squares
+REDUCE_BATCH_NBYTES = 64 * 1024**2 # memory budget per batch when reducing, the batches are only needed for one update
+
+
+class RunningStats:
+    """
+    Statistics over the first axis of a sequence of batches (i.e., per element of the remaining axes) in constant memory:
+    - count, sum, mean and var/std (population, i.e., ddof=0) via Welford's online algorithm,
+      where each batch is merged as a whole (Chan et al.), which is both vectorized and numerically stable
+    - min and max
+    - hist counts all values (of all elements) into the fixed bins (edges), which are needed for hist only
+    Statistics of an empty sequence are None, except count (0) and hist (zeros).
+    The batches are not converted to float64 as a whole, the centred squares are calculated in blocks of rows
+    in a reused buffer of at most BLOCK_BYTES (or one row), i.e., the extra memory does not depend on the batch size.
+    """
+
+    def __init__(self, bins=None):
+        self.bins = bins
+        self.count = 0
+        self.mean = self.m2 = self.min = self.max = None
+        self.hist = None if bins is None else np.zeros(len(bins) - 1, dtype=int)
+
+    def update(self, batch):
+        batch = np.asanyarray(batch)
+        nbatch = len(batch)
+        if nbatch == 0:
+            return
+
+        batch_mean = batch.mean(axis=0, dtype=np.float64)
+        batch_m2 = centred_squares_sum(batch, batch_mean)
+        batch_min = batch.min(axis=0)
+        batch_max = batch.max(axis=0)
+
+        if self.hist is not None:
+            self.hist += np.histogram(batch, bins=self.bins)[0]
+
+        if self.count == 0:
+            self.count = nbatch
+            self.mean, self.m2 = batch_mean, batch_m2
+            self.min, self.max = batch_min, batch_max
+            return
+
+        ntotal = self.count + nbatch
+        delta = batch_mean - self.mean
+        self.mean = self.mean + delta * (nbatch / ntotal)
+        self.m2 = self.m2 + batch_m2 + np.square(delta) * (self.count * nbatch / ntotal)
+        self.min = np.minimum(self.min, batch_min)
+        self.max = np.maximum(self.max, batch_max)
+        self.count = ntotal
+
+    @property
+    def sum(self):
+        return None if self.mean is None else self.mean * self.count
+
+    @property
+    def var(self):
+        return None if self.m2 is None else self.m2 / self.count
+
+    @property
+    def std(self):
+        var = self.var
+        return None if var is None else np.sqrt(var)
+
+    def get(self, which):
+        if which not in REDUCTIONS:
+            raise ValueError(f"unknown reduction {which!r}, can only calculate: {REDUCTIONS}")
+        return getattr(self, which)
+
+
+
+def centred_squares_sum(batch, mean, block_bytes=BLOCK_BYTES):
+    """sum of (batch - mean)**2 over the first axis, calculated in blocks of rows in one reused float64 buffer"""
+    row_shape = batch.shape[1:]
+    row_bytes = max(int(np.prod(row_shape)), 1) * 8
+    nblock = min(max(block_bytes // row_bytes, 1), len(batch))
+    buffer = np.empty((nblock, *row_shape), dtype=np.float64)
+    res = np.zeros(row_shape, dtype=np.float64)
+    for start in range(0, len(batch), nblock):
+        rows = batch[start:start + nblock]
+        out = buffer[:len(rows)]
+        np.subtract(rows, mean, out=out)
+        np.square(out, out=out)
+        res += out.sum(axis=0)
+    return res
+
+
+
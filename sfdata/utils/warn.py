@@ -1,4 +1,7 @@
-from warnings import warn
+import threading
+import warnings
+from collections import defaultdict
+from warnings import warn, warn_explicit
 
 from .utils import typename
 
@@ -9,3 +12,73 @@ def print_skip_warning(exc, name):
 
 
 
+class WarningCollector:
+    """
+    Collect the warnings issued by functions running in worker threads (via run),
+    tagged by a key per call (e.g., the index of the item or batch), which can be reissued in the consuming thread later (via reissue).
+    Reissuing the keys in order keeps the output order deterministic and independent of the thread scheduling.
+    Only warnings from threads currently inside run are collected, warnings from all other threads are displayed as usual.
+    While any collector is active, the process-wide warning display is replaced by a dispatcher (see _dispatch_warning),
+    which sends each warning to the innermost run of the issuing thread. Hence, collectors can be nested and used from several threads.
+    """
+
+    def __init__(self):
+        self.records = defaultdict(list)
+
+    def __enter__(self):
+        _install_dispatcher()
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        _uninstall_dispatcher()
+
+    def run(self, key, func, *args, **kwargs):
+        previous = getattr(_current, "target", None)
+        _current.target = (self, key)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            _current.target = previous
+
+    def record(self, key, message, category, filename, lineno):
+        self.records[key].append((message, category, filename, lineno))
+
+    def reissue(self, key):
+        for message, category, filename, lineno in self.records.pop(key, ()):
+            warn_explicit(message, category, filename, lineno)
+
+
+
+_current = threading.local() # (collector, key) of the innermost run per thread
+_lock = threading.Lock()
+_nactive = 0
+_showwarning = None
+
+
+def _install_dispatcher():
+    global _nactive, _showwarning
+    with _lock:
+        if _nactive == 0:
+            _showwarning = warnings.showwarning
+            warnings.showwarning = _dispatch_warning
+        _nactive += 1
+
+
+def _uninstall_dispatcher():
+    global _nactive
+    with _lock:
+        _nactive -= 1
+        if _nactive == 0:
+            warnings.showwarning = _showwarning
+
+
+def _dispatch_warning(message, category, filename, lineno, file=None, line=None):
+    target = getattr(_current, "target", None)
+    if target is None: # not inside run
+        _showwarning(message, category, filename, lineno, file=file, line=line)
+        return
+    collector, key = target
+    collector.record(key, message, category, filename, lineno)
+
+
+
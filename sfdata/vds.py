@@ -0,0 +1,154 @@
+import os
+from collections import defaultdict
+
+import h5py
+import numpy as np
+
+from .errors import NoMatchingFileError
+from .utils import enquote, printable_string_sequence, print_skip_warning
+from .sfdatafiles import explode_filenames
+from .ign import remove_ignored_filetypes_run
+
+
+VDS_DATASETS = ("data", "pulse_id", "timestamp") # timestamp is optional, i.e., only mapped if present in all files
+
+
+def write_vds(fname, *patterns, mode="x"):
+    """
+    Write the HDF5 file fname that maps the channels of all files matching patterns via virtual datasets,
+    channels that occur in several files are concatenated along the pulse-id axis (in the order of the sorted filenames)
+    see write_vds_files for details
+    """
+    fnames = explode_filenames(patterns)
+    fnames = remove_ignored_filetypes_run(fnames)
+    if not fnames:
+        patterns = printable_string_sequence(patterns)
+        raise NoMatchingFileError(patterns)
+    return write_vds_files(fname, fnames, mode=mode)
+
+
+def write_vds_files(fname, fnames, mode="x"):
+    """
+    Write the HDF5 file fname containing one group /data/<channel> per channel of fnames (in the given order)
+    with virtual datasets for data, pulse_id and (if available) timestamp, which refer to the original files by absolute path:
+    - no data is copied, the file only contains the mapping and can be opened like any other file, e.g., via SFDataFile
+    - opening it costs a single file open instead of one per original file
+    - channels with differing dtype or shape per entry are skipped with a warning
+    Note that the original files need to stay in place, and missing files read as zeros.
+    """
+    with h5py.File(fname, mode=mode) as f:
+        write_channels(f, fnames)
+
+
+def write_vds_steps(fname, steps, mode="x"):
+    """
+    Write the HDF5 file fname that maps the channels of the files of all steps (one list of filenames per step) like write_vds_files,
+    and additionally store the step boundaries, which allow to recover the data of each step (see read_vds_steps):
+    - /steps/fnames: the absolute filenames of all steps, fnames[file_offsets[i]:file_offsets[i+1]] belong to step i
+    - /steps/file_offsets: see above
+    - attribute step_offsets of each channel group: the rows step_offsets[i]:step_offsets[i+1] belong to step i
+    """
+    fnames = [fn for fns in steps for fn in fns]
+    nfiles = [len(fns) for fns in steps]
+    with h5py.File(fname, mode=mode) as f:
+        write_channels(f, fnames, nfiles)
+        group = f.create_group("steps")
+        group["fnames"] = [os.path.abspath(fn) for fn in fnames]
+        group["file_offsets"] = np.cumsum([0, *nfiles])
+
+
+def read_vds_steps(fname):
+    """
+    Read the step boundaries from the HDF5 file fname written by write_vds_steps (e.g., via SFScanInfo.write_vds) and return:
+    - the list of filenames of each step
+    - a dict {channel: list of row slices of each step}
+    """
+    with h5py.File(fname, mode="r") as f:
+        fnames = f["steps/fnames"].asstr()[:].tolist()
+        file_offsets = f["steps/file_offsets"][:]
+        steps = [fnames[start:stop] for start, stop in zip(file_offsets[:-1], file_offsets[1:])]
+        rows = {}
+        for name, group in f["data"].items():
+            offsets = group.attrs["step_offsets"]
+            rows[name] = [slice(int(start), int(stop)) for start, stop in zip(offsets[:-1], offsets[1:])]
+    return steps, rows
+
+
+def write_channels(f, fnames, nfiles=None):
+    """
+    Create one group /data/<channel> per channel of fnames in the opened HDF5 file f (see write_vds_files),
+    with nfiles (the number of consecutive files in fnames per step), the rows of each step are stored in the attribute step_offsets
+    """
+    sources = collect_sources(fnames)
+    if nfiles is not None:
+        step_ids = np.repeat(np.arange(len(nfiles)), nfiles)
+    data = f.create_group("data")
+    for name, parts in sources.items():
+        file_ids, parts = zip(*parts)
+        try:
+            layouts = make_layouts(parts)
+        except ValueError as exc:
+            cn = enquote(name)
+            cn = f"channel {cn}"
+            print_skip_warning(exc, cn)
+            continue
+        group = data.create_group(name)
+        for which, layout in layouts.items():
+            group.create_virtual_dataset(which, layout)
+        if nfiles is not None:
+            nrows = [p["pulse_id"].shape[0] for p in parts]
+            rows_per_step = np.bincount(step_ids[list(file_ids)], weights=nrows, minlength=len(nfiles))
+            group.attrs["step_offsets"] = np.cumsum([0, *rows_per_step]).astype(int)
+
+
+def collect_sources(fnames):
+    """for each channel in fnames, collect one tuple (index of the file, {which: VirtualSource}) per file that contains the channel"""
+    sources = defaultdict(list)
+    for i, fn in enumerate(fnames):
+        path = os.path.abspath(fn)
+        with h5py.File(path, mode="r") as h5:
+            group = h5["data"] if "data" in h5 else h5 # same as load_from_generic_file
+            for name in group:
+                chan = group[name]
+                if not isinstance(chan, h5py.Group) or "data" not in chan or "pulse_id" not in chan:
+                    continue
+                sources[name].append((i, {
+                    which: h5py.VirtualSource(chan[which])
+                    for which in VDS_DATASETS if which in chan
+                }))
+    return sources
+
+
+def make_layouts(parts):
+    """concatenate the VirtualSources of each dataset of a channel along the first axis"""
+    whiches = [w for w in VDS_DATASETS if all(w in p for p in parts)]
+    layouts = {}
+    for which in whiches:
+        srcs = [p[which] for p in parts]
+        check_compatible(which, srcs)
+
+        first = srcs[0]
+        nrows = sum(s.shape[0] for s in srcs)
+        layout = h5py.VirtualLayout(shape=(nrows, *first.shape[1:]), dtype=first.dtype)
+
+        start = 0
+        for s in srcs:
+            stop = start + s.shape[0]
+            if stop > start: # empty sources cannot be mapped
+                layout[start:stop] = s
+            start = stop
+
+        layouts[which] = layout
+    return layouts
+
+
+def check_compatible(which, srcs):
+    first = srcs[0]
+    for s in srcs[1:]:
+        if s.dtype != first.dtype:
+            raise ValueError(f"{which} has differing dtypes: {first.dtype} and {s.dtype}")
+        if s.shape[1:] != first.shape[1:]:
+            raise ValueError(f"{which} has differing shapes per entry: {first.shape[1:]} and {s.shape[1:]}")
+
+
+
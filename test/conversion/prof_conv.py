@@ -37,6 +37,13 @@ def convprof(fname):
         sfd.to_dataframe_fill
     )
 
+    def to_dataframe_wide(**kwargs):
+        return sfd.to_dataframe(wide=True, **kwargs)
+
+    run_all(
+        to_dataframe_wide
+    )
+
     run_all(
         sfd.to_xarray,
         sfd.to_xarray_accumulate
@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+
+# ./prof_roi.py
+# compares repeated ROI reads of large compressed images with the default and the automatically tuned chunk cache
+
+
+import argparse
+
+parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+parser.add_argument("filename", nargs='?', default="test_roi.h5", help="name of the file to run the profiling on (created if it does not exist)")
+parser.add_argument("-n", "--nimages", type=int, default=5, help="number of images to read ROIs from")
+parser.add_argument("-r", "--nrois", type=int, default=20, help="number of ROIs to read per image")
+
+clargs = parser.parse_args()
+
+
+import os
+import sys
+from time import time
+
+import h5py
+import numpy as np
+
+this_dir = os.path.dirname(__file__)
+sys.path.insert(0, (os.path.join(this_dir, "../..")))
+
+from sfdata import SFDataFile
+
+
+DEFAULT_RDCC_NBYTES = 1024**2 # HDF5 default
+
+
+def create(fname, nimages, shape=(2048, 4096)):
+    data = np.random.poisson(3, (nimages, *shape)).astype(np.uint16)
+    with h5py.File(fname, "w") as f:
+        f.create_dataset("data/cam/data", data=data, chunks=(1, *shape), compression="gzip") # 16 MB per chunk
+        f["data/cam/pulse_id"] = np.arange(nimages)
+
+
+def read_rois(fname, nimages, nrois, **kwargs):
+    with SFDataFile(fname, **kwargs) as data:
+        ch = data["cam"]
+        start = time()
+        for i in range(nimages):
+            for j in range(nrois):
+                ch[i, 100+j*10:110+j*10, 200:300]
+        return time() - start
+
+
+
+
+
+if __name__ == "__main__":
+    fname = clargs.filename
+    if not os.path.isfile(fname):
+        create(fname, clargs.nimages)
+
+    for label, kwargs in (("default", dict(rdcc_nbytes=DEFAULT_RDCC_NBYTES)), ("auto", {})):
+        duration = read_rois(fname, clargs.nimages, clargs.nrois, **kwargs)
+        print(f"{label}: {duration:.2f} s")
+
+
+
@@ -150,6 +150,52 @@ class TestSFChannel(TestCase):
                     )
 
 
+    @unittest.mock.patch("sfdata.sfdata.tqdm", identity)
+    def test_to_dataframe_wide(self):
+        data = self.data
+        for show_progress in (True, False):
+            df = data.to_dataframe(wide=True, show_progress=show_progress)
+
+            self.assertAllEqual(
+                df.index, self.df_ref_lists.index
+            )
+            self.assertEqual(
+                df.shape, (3, 3 * 1 + 3 + 9 + 3) # 3 scalar channels, ch4: 3, ch5: 3x3, ch6: 3
+            )
+            self.assertTrue(
+                all(dtype == float for dtype in df.dtypes)
+            )
+
+            for name in data.names:
+                chan = data[name]
+                ref = chan.data.reshape(len(chan.data), -1)
+                sub = df.loc[chan.pids, name]
+                self.assertAllEqual(
+                    sub.to_numpy().reshape(ref.shape), ref
+                )
+
+        self.assertAllEqual(
+            df[CH_1D_NAME], CH_1D_DATA
+        )
+
+    def test_to_dataframe_wide_dtypes(self):
+        with SFDataFiles("fake_data/run_dtypes.SCALARS.h5") as data:
+            df_native   = data.to_dataframe(wide=True)
+            df_nullable = data.to_dataframe(wide=True, as_nullable=True)
+
+            for name in data.names:
+                ref = name[0] # first char in channel names is type code
+                dtype = df_nullable[name].dtype
+                self.assertEqual(
+                    dtype.kind, ref
+                )
+                is_complete = (len(data[name].pids) == len(data.all_pids))
+                if is_complete: # channels without missing pids keep their native dtype
+                    self.assertEqual(
+                        df_native[name].dtype, data[name].dtype
+                    )
+
+
     @unittest.mock.patch("sfdata.sfdata.tqdm", identity)
     def test_to_xarray(self):
         #TODO: reference only works for 1D arrays
@@ -177,6 +223,24 @@ class TestSFChannel(TestCase):
                 )
 
 
+    def test_to_xarray_lazy(self):
+        data = self.data["ch1", "ch2", "ch3", CH_ND_NAME]
+        data.drop_missing()
+        ref = data.to_xarray()
+        xr = data.to_xarray(lazy=True)
+        for name in data.names:
+            self.assertEqual(type(xr[name].data).__name__, "Array") # dask array
+        self.assertAllEqual(
+            xr.pids, ref.pids
+        )
+        self.assertTrue(
+            xr.equals(ref)
+        )
+        self.assertTrue(
+            xr.compute().equals(ref)
+        )
+
+
     def test_drop_missing(self):
         self.data.drop_missing()
         self.assertAllEqual(
@@ -264,12 +328,16 @@ class TestSFChannel(TestCase):
                 n = i + 1
                 m = j + 1
 
-                res = []
-                for index, batch in self.data[CH_1D_NAME].in_batches(n, m):
-                    res.extend(batch)
-                self.assertAllEqual(
-                    res, CH_1D_DATA[:n*m]
-                )
+                for kwargs in ({}, {"prefetch": 2}, {"reuse_buffer": True}):
+                    res = []
+                    for index, batch in self.data[CH_1D_NAME].in_batches(n, m, **kwargs):
+                        res.extend(batch)
+                    self.assertAllEqual(
+                        res, CH_1D_DATA[:n*m]
+                    )
+
+        with self.assertRaises(ValueError):
+            self.data[CH_1D_NAME].in_batches(prefetch=2, reuse_buffer=True)
 
 
     def test_apply_in_batches(self):
@@ -285,6 +353,21 @@ class TestSFChannel(TestCase):
                 )
 
 
+    def test_apply_in_batches_workers(self):
+        ch = self.data[CH_ND_NAME]
+        ref = ch.data.sum(axis=(1, 2))
+        for size in (1, 2):
+            res = ch.apply_in_batches(sum_images, size, workers=2, executor="thread")
+            self.assertAllEqual(res, ref)
+
+        ch.valid = [0, 2]
+        res = ch.apply_in_batches(sum_images, 1, workers=2, executor="process") # starting processes is slow, thus only once
+        self.assertAllEqual(res, ref[[0, 2]])
+
+        with self.assertRaises(ValueError):
+            ch.apply_in_batches(sum_images, workers=2, executor="not an executor")
+
+
     def test_broken(self):
         ch = self.data[CH_1D_NAME]
         with self.assertNotRaises():
@@ -303,3 +386,8 @@ class TestSFChannel(TestCase):
 
 
 
+def sum_images(batch): # needs to be importable for process workers
+    return batch.sum(axis=(1, 2))
+
+
+
@@ -31,12 +31,21 @@ class TestSFChannelJF(TestCase):
             )
 
 
+    @unittest.mock.patch("sfdata.sfdatafile.ju")
+    @unittest.mock.patch("sfdata.sfdatafile.load_from_ju_file")
+    def test_h5_kwargs_ignored(self, load, _):
+        msg = "jungfrau_utils does not support h5py.File arguments, ignoring for JF files: swmr, rdcc_nbytes"
+        with self.assertWarns(msg):
+            sfdata.sfdatafile.load_from_file(self.fname, swmr=True, rdcc_nbytes=1024)
+        load.assert_called_once_with(self.fname, cache=None)
+
+
     @unittest.mock.patch("sfdata.sfdatafile.ju", None)
     def test_no_ju(self):
         modfname = sfdata.sfdatafile.__file__
-        line = 24 #TODO this will break!
+        line = 32 #TODO this will break!
         prefix = f"{modfname}:{line}: UserWarning: "
-        suffix = "\n  self.file, channels = load_from_file(fname)"
+        suffix = "\n  self.file, channels, self.metas = load_from_file(fname, cache=self.cache, lazy=lazy, chunk_workers=chunk_workers, mmap=mmap, index_dir=self.meta_index_dir, **h5_kwargs)"
         msg = "Could not import jungfrau_utils, will treat JF files as regular files."
         msg = prefix + msg + suffix
         with self.assertPrintsError(msg):
@@ -1,13 +1,26 @@
 #!/usr/bin/env python
 
+import io
+import os
 import sys
+import shutil
+import subprocess
+import tempfile
+import unittest.mock
+import warnings
+from contextlib import redirect_stdout
+import h5py
+import bitshuffle.h5
+import numpy as np
 
-from utils import TestCase, check_channel_closed
+from utils import TestCase, check_channel_closed, ClosedH5Error, make_temp_filename
 from hiddenmod import HiddenModule
 from consts import FNAME_SCALARS, REPR_FILE, CH_1D_NAME, CH_1D_DATA, CH_1D_COL_NAME
 
 from sfdata import SFDataFile
-from sfdata.errors import NoUsableChannelError
+from sfdata.sflazychannel import SFLazyChannel
+from sfdata.utils.directchunk import DirectChunkDataset
+from sfdata.errors import NoUsableChannelError, DatasetNotInGroupError
 
 
 class TestSFDataFile(TestCase):
@@ -67,6 +80,257 @@ class TestSFDataFile(TestCase):
             with SFDataFile("fake_data/run_spurious_chans_only.ARRAYS.h5") as data:
                 pass
 
+    def test_lazy(self):
+        with SFDataFile(FNAME_SCALARS, lazy=True) as data:
+            self.assertEqual(
+                repr(data), REPR_FILE
+            )
+            self.assertEqual(len(data), 3)
+            placeholder = data.data[CH_1D_NAME]
+            self.assertIsInstance(placeholder, SFLazyChannel)
+            self.assertFalse(placeholder.is_materialized)
+
+            subset = data[CH_1D_NAME, CH_1D_COL_NAME] # subsets do not materialize
+            self.assertFalse(placeholder.is_materialized)
+
+            ch = data[CH_1D_NAME]
+            self.assertTrue(placeholder.is_materialized)
+            self.assertIs(data[CH_1D_NAME], ch)
+            self.assertIs(subset[CH_1D_NAME], ch)
+            self.assertAllEqual(ch.data, CH_1D_DATA)
+
+            other = data.data[CH_1D_COL_NAME]
+        check_channel_closed(self, ch)
+        with self.assertRaises(ClosedH5Error):
+            other.materialize()
+
+    def test_lazy_spurious_chans(self):
+        with self.assertWarns():
+            with SFDataFile("fake_data/run_spurious_chans.ARRAYS.h5", lazy=True) as data:
+                self.assertTrue("file_create_date" not in data)
+                self.assertTrue("pulse_id" not in data)
+        with self.assertRaises(NoUsableChannelError):
+            SFDataFile("fake_data/run_spurious_chans_only.ARRAYS.h5", lazy=True)
+
+    def test_lazy_broken_chan(self):
+        with SFDataFile(FNAME_SCALARS, lazy=True) as data:
+            data.data["data"] = SFLazyChannel("data", data.file) # group without the channel datasets
+            with self.assertRaises(DatasetNotInGroupError):
+                data["data"]
+
+
+    def test_chunk_workers(self):
+        fname = make_temp_filename(suffix=".h5")
+        ref = np.arange(20 * 3 * 2, dtype=np.uint16).reshape(20, 3, 2)
+
+        with h5py.File(fname, "w") as f:
+            f.create_dataset("data/images/data", data=ref, chunks=(1, 3, 2), compression=bitshuffle.h5.H5FILTER, compression_opts=(0, bitshuffle.h5.H5_COMPRESS_LZ4))
+            f["data/images/pulse_id"] = np.arange(20)
+
+        for lazy in (False, True):
+            with SFDataFile(fname, lazy=lazy, chunk_workers=2) as data:
+                ch = data["images"]
+                self.assertIsInstance(ch.datasets.data, DirectChunkDataset)
+                self.assertAllEqual(ch.data, ref)
+                self.assertAllEqual(ch[3:5, 1], ref[3:5, 1])
+                ch.valid = np.arange(0, 20, 3)
+                self.assertAllEqual(ch.data, ref[::3])
+                self.assertAllEqual(ch.apply_in_batches(lambda b: b.sum(axis=(1, 2)), 2), ref[::3].sum(axis=(1, 2)))
+            check_channel_closed(self, ch)
+
+        with SFDataFile(fname) as data:
+            self.assertNotIsInstance(data["images"].datasets.data, DirectChunkDataset)
+
+        os.remove(fname)
+
+
+    def test_chunk_cache(self):
+        fname = make_temp_filename(suffix=".h5")
+        ref = np.zeros((4, 1024, 1024), dtype=np.float64) # 8 MB per chunk
+
+        with h5py.File(fname, "w") as f:
+            f.create_dataset("data/images/data", data=ref, chunks=(1, 1024, 1024))
+            f["data/images/pulse_id"] = np.arange(4)
+
+        get_chunk_cache = lambda ch: ch.datasets.data.id.get_access_plist().get_chunk_cache()
+
+        for lazy in (False, True):
+            with SFDataFile(fname, lazy=lazy) as data:
+                nslots, nbytes, w0 = get_chunk_cache(data["images"])
+                self.assertEqual(nbytes, 2 * 8 * 1024**2) # two chunks
+                self.assertAllEqual(data["images"][1, :2, :2], ref[1, :2, :2])
+
+        with SFDataFile(fname, rdcc_nbytes=1024**2, rdcc_nslots=10007, rdcc_w0=1) as data: # explicit settings are not changed
+            self.assertEqual(
+                data.file.id.get_access_plist().get_cache()[1:], (10007, 1024**2, 1)
+            )
+            self.assertEqual(
+                get_chunk_cache(data["images"])[1:], (1024**2, 1)
+            )
+
+        with SFDataFile(fname, driver="core") as data:
+            self.assertEqual(data.file.driver, "core")
+
+        os.remove(fname)
+
+
+    def test_mmap(self):
+        fname = make_temp_filename(suffix=".h5")
+        ref = np.arange(20 * 4, dtype=np.float32).reshape(20, 4)
+
+        with h5py.File(fname, "w") as f:
+            f["data/contiguous/data"] = ref
+            f["data/contiguous/pulse_id"] = np.arange(20)
+            f.create_dataset("data/chunked/data", data=ref, chunks=(5, 4), compression="gzip")
+            f["data/chunked/pulse_id"] = np.arange(20)
+
+        for lazy in (False, True):
+            with SFDataFile(fname, lazy=lazy, mmap=True) as data:
+                ch = data["contiguous"]
+                self.assertEqual(set(ch.mmaps), {"data", "pids"})
+                self.assertIsInstance(ch.data, np.memmap)
+                self.assertAllEqual(ch.data, ref)
+                self.assertAllEqual(ch.pids, np.arange(20))
+                self.assertAllEqual(ch[2:4, 1], ref[2:4, 1])
+
+                ch.valid = np.arange(5, 15)
+                self.assertTrue(np.shares_memory(ch.data, ch.mmaps["data"]))
+                ch.valid = np.arange(0, 20, 3)
+                self.assertAllEqual(ch.data, ref[::3])
+                self.assertAllEqual(ch.apply_in_batches(lambda b: b.sum(axis=1), 2), ref[::3].sum(axis=1))
+
+                chunked = data["chunked"]
+                self.assertEqual(set(chunked.mmaps), {"pids"})
+                self.assertAllEqual(chunked.data, ref)
+
+            check_channel_closed(self, ch)
+
+        with SFDataFile(fname) as data:
+            self.assertEqual(data["contiguous"].mmaps, {})
+
+        os.remove(fname)
+
+
+    def test_meta_index(self):
+        fname = make_temp_filename(suffix=".h5")
+        index_dir = tempfile.mkdtemp()
+
+        with h5py.File(fname, "w") as f:
+            f["data/a/data"] = np.arange(10)
+            f["data/a/pulse_id"] = np.arange(10)
+            f.create_dataset("data/b/data", data=np.zeros((10, 2, 3)), chunks=(5, 2, 3))
+            f["data/b/pulse_id"] = np.arange(5, 15)
+            f["data/b/timestamp"] = np.arange(10)
+            f["data/spurious/something"] = np.arange(10)
+
+        def print_stats(data):
+            with redirect_stdout(io.StringIO()) as out:
+                data.print_stats(color=False)
+            return out.getvalue()
+
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore") # the spurious channel is skipped
+            with SFDataFile(fname) as data:
+                ref_stats = print_stats(data)
+
+        for i, lazy in enumerate((False, True, False)): # the index is created the first time and contains the pid statistics after the first print_stats
+            with SFDataFile(fname, lazy=lazy, meta_index=index_dir) as data:
+                self.assertEqual(sorted(data.names), ["a", "b"])
+                self.assertTrue(all(isinstance(ch, SFLazyChannel) for ch in data.data.values())) # the datasets are only opened on access
+                self.assertEqual(print_stats(data), ref_stats)
+                self.assertEqual(any(ch.is_materialized for ch in data.data.values()), i == 0) # afterwards answered from the index
+                meta = data["b"].meta
+                self.assertEqual(meta["shape"], [10, 2, 3])
+                self.assertEqual(meta["chunks"], [5, 2, 3])
+                self.assertTrue(meta["timestamps"])
+                self.assertEqual(meta["pids"], dict(min=5, max=14, count=10, sorted=True))
+            self.assertEqual(len(os.listdir(index_dir)), 1)
+
+        opened = []
+        dataset_init = h5py.Dataset.__init__
+        def counting_init(ds, *args, **kwargs):
+            opened.append(ds)
+            dataset_init(ds, *args, **kwargs)
+
+        with unittest.mock.patch.object(h5py.Dataset, "__init__", counting_init):
+            with SFDataFile(fname, meta_index=index_dir) as data:
+                placeholder = data.data["b"] # the raw dict keeps the placeholder
+                self.assertEqual(placeholder.shape, (10, 2, 3))
+                self.assertEqual(placeholder.dtype, np.float64)
+                self.assertEqual(placeholder.ntotal, 10)
+                self.assertEqual(len(placeholder), 10)
+                self.assertEqual(len(opened), 0) # answered from the index
+                self.assertFalse(placeholder.is_materialized)
+                self.assertEqual(data["b"].shape, (10, 2, 3))
+                self.assertGreater(len(opened), 0)
+
+        with h5py.File(fname, "a") as f: # changing the file invalidates the index
+            f["data/c/data"] = np.arange(3)
+            f["data/c/pulse_id"] = [0, 5, 7] # not a complete range, thus the pids need to be read
+
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore") # the spurious channel is skipped
+            with SFDataFile(fname) as data:
+                ref_stats = print_stats(data)
+
+        with SFDataFile(fname, lazy=True, meta_index=index_dir) as data:
+            self.assertEqual(sorted(data.names), ["a", "b", "c"])
+            self.assertEqual(print_stats(data), ref_stats)
+
+        shutil.rmtree(index_dir)
+        os.remove(fname)
+
+
+    def test_follow(self):
+        fname = make_temp_filename(suffix=".h5")
+
+        with h5py.File(fname, "w", libver="latest") as f: # SWMR needs chunked datasets with unlimited first axis
+            f.create_dataset("data/ch/data", shape=(0, 3), maxshape=(None, 3), chunks=(4, 3), dtype=float)
+            f.create_dataset("data/ch/pulse_id", shape=(0,), maxshape=(None,), chunks=(4,), dtype=int)
+
+        writer = f"""
+import time
+import h5py
+with h5py.File({fname!r}, "a", libver="latest") as f:
+    f.swmr_mode = True
+    print("ready", flush=True)
+    data = f["data/ch/data"]
+    pids = f["data/ch/pulse_id"]
+    for i in range(5):
+        time.sleep(0.05)
+        n = len(pids)
+        data.resize(n + 2, axis=0)
+        data[n:] = i
+        data.flush()
+        pids.resize(n + 2, axis=0)
+        pids[n:] = [n, n + 1]
+        pids.flush()
+"""
+        proc = subprocess.Popen([sys.executable, "-c", writer], stdout=subprocess.PIPE, text=True)
+        self.assertEqual(proc.stdout.readline(), "ready\n") # readers can only open the file after the writer enabled SWMR mode
+
+        with SFDataFile(fname, follow=True) as data:
+            ch = data["ch"]
+            blocks = []
+            npids = 0
+            for pids, block in ch.iter_new(poll=0.01, timeout=10):
+                self.assertEqual(len(pids), len(block))
+                blocks.append(block)
+                npids += len(pids)
+                if npids == 10:
+                    break
+            proc.wait()
+
+            self.assertAllEqual(np.concatenate(blocks), np.repeat(np.arange(5), 2)[:, None] * np.ones(3))
+            self.assertEqual(list(ch.iter_new(poll=0.01, timeout=0.05, start=None)), []) # the writer is done, nothing new
+
+            ch.refresh()
+            self.assertAllEqual(ch.pids, np.arange(10))
+
+        proc.stdout.close()
+        os.remove(fname)
+
+
     def test_missing_ju_import(self):
         import sfdata.sfdatafile
         self.assertNotEqual(
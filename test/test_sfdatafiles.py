@@ -1,11 +1,18 @@
 #!/usr/bin/env python
 
-from utils import TestCase, check_channel_closed
-from consts import FNAME_ALL, REPR_FILES, CH_1D_NAME, CH_1D_DATA, CH_ND_NAME, CH_ND_DATA1
+import os
+import warnings
+import h5py
+import numpy as np
+
+from utils import TestCase, check_channel_closed, make_temp_filename
+from consts import FNAME_ALL, REPR_FILES, CH_1D_NAME, CH_1D_DATA, CH_1D_PIDS, CH_ND_NAME, CH_ND_DATA1
 
 import sfdata
 from sfdata import SFDataFiles
-from sfdata.errors import NoMatchingFileError
+from sfdata.sflazychannel import SFLazyChannel
+from sfdata.sfconcatchannel import SFConcatChannel
+from sfdata.errors import NoMatchingFileError, UnorderedPidsError
 
 
 class TestSFDataFiles(TestCase):
@@ -34,7 +41,7 @@ class TestSFDataFiles(TestCase):
         with self.assertRaises(NoMatchingFileError):
             SFDataFiles("does not exist")
         modfname = sfdata.sfdatafiles.__file__
-        line = 65 #TODO this will break!
+        line = 83 #TODO this will break!
         prefix = f"{modfname}:{line}: UserWarning: "
         suffix = "\n  print_skip_warning(exc, quoted_fn)"
         broken_file = "fake_data/run_broken.SCALARS.h5"
@@ -75,4 +82,157 @@ class TestSFDataFiles(TestCase):
         check_channel_closed(self, ch)
 
 
+    def test_cache(self):
+        self.assertIsNone(self.data.cache)
+
+        with SFDataFiles(FNAME_ALL, cache="pids") as data:
+            self.assertEqual(data.cache.which, {"pids"})
+            for f in data.files:
+                self.assertIs(f.cache, data.cache)
+
+            ch = data[CH_1D_NAME]
+            key = (ch.fs.name, ch.name, "pids")
+            self.assertNotIn(key, data.cache)
+            self.assertAllEqual(ch.pids, CH_1D_PIDS)
+            self.assertIn(key, data.cache)
+            self.assertAllEqual(ch.pids, CH_1D_PIDS)
+
+            ch.valid = [0, 2]
+            self.assertAllEqual(ch.pids, [CH_1D_PIDS[0], CH_1D_PIDS[2]])
+            self.assertAllEqual(ch.data, [CH_1D_DATA[0], CH_1D_DATA[2]])
+            self.assertEqual(len(data.cache), 1) # data is not cached
+            ch.reset_valid()
+
+            pids = ch.pids
+            pids[0] = -1 # must not change the cached array
+            self.assertAllEqual(ch.pids, CH_1D_PIDS)
+
+        self.assertEqual(len(data.cache), 0)
+        check_channel_closed(self, ch)
+
+    def test_cache_bytes(self):
+        with SFDataFiles(FNAME_ALL, cache_bytes=1024) as data:
+            self.assertEqual(data.cache.max_nbytes, 1024)
+            self.assertEqual(data.cache.which, {"pids", "data", "timestamps"})
+            data.drop_missing()
+            self.assertAllEqual(data[CH_1D_NAME].data, [CH_1D_DATA[0], CH_1D_DATA[2]])
+            self.assertLessEqual(data.cache.nbytes, 1024)
+
+    def test_lazy(self):
+        with SFDataFiles(FNAME_ALL, lazy=True) as data:
+            self.assertEqual(sorted(data.names), sorted(self.data.names))
+            self.assertTrue(all(isinstance(ch, SFLazyChannel) for ch in data.data.values()))
+
+            data.drop_missing()
+            self.assertAllEqual(data[CH_1D_NAME].data, [CH_1D_DATA[0], CH_1D_DATA[2]])
+            self.assertFalse(any(isinstance(ch, SFLazyChannel) for ch in data.data.values()))
+
+            # the files see the same channels
+            for f in data.files:
+                for name, ch in f.data.items():
+                    self.assertIs(ch.materialize(), data[name])
+
+            ch = data[CH_1D_NAME]
+        check_channel_closed(self, ch)
+
+    def test_h5_kwargs(self):
+        with SFDataFiles(FNAME_ALL, rdcc_nbytes=123456) as data:
+            self.assertEqual(data.h5_kwargs, {"rdcc_nbytes": 123456}) # the files are already open in run(), thus HDF5 reuses their settings
+            self.assertAllEqual(data[CH_1D_NAME].data, CH_1D_DATA)
+
+    def test_workers(self):
+        with SFDataFiles(FNAME_ALL, workers=4) as data:
+            self.assertEqual(data.fnames, self.data.fnames)
+            self.assertEqual(sorted(data.names), sorted(self.data.names))
+            self.assertAllEqual(data[CH_1D_NAME].data, CH_1D_DATA)
+
+        broken_file = "fake_data/run_broken.SCALARS.h5"
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter("always")
+            with SFDataFiles(broken_file, FNAME_ALL, workers=4) as data:
+                self.assertNotIn(broken_file, data.fnames)
+                self.assertEqual(len(data.files), 2)
+        self.assertEqual(len(caught), 1)
+        msg = str(caught[0].message)
+        self.assertTrue(msg.startswith(f"Skipping \"{broken_file}\" since it caused OSError"))
+
+
+    def test_concat(self):
+        ref = np.arange(30 * 2, dtype=np.float32).reshape(30, 2)
+        pids = np.arange(100, 130)
+        bounds = (0, 12, 12, 30) # includes an empty acquisition
+
+        fnames = []
+        for i, (start, stop) in enumerate(zip(bounds[:-1], bounds[1:])):
+            fname = make_temp_filename(prefix=f"acq{i:04}.", suffix=".h5")
+            with h5py.File(fname, "w") as f:
+                f["data/images/data"] = ref[start:stop]
+                f["data/images/pulse_id"] = pids[start:stop]
+                f["data/other/data"] = np.full(stop - start, i)
+                f["data/other/pulse_id"] = pids[start:stop]
+            fnames.append(fname)
+
+        for lazy in (False, True):
+            for mmap in (False, True):
+                with SFDataFiles(*fnames, lazy=lazy, mmap=mmap) as data:
+                    self.assertEqual(sorted(data.names), ["images", "other"])
+                    ch = data["images"]
+                    self.assertIsInstance(ch, SFConcatChannel)
+                    self.assertEqual(len(ch.parts), 3)
+                    self.assertEqual(ch.shape, ref.shape)
+                    self.assertAllEqual(ch.pids, pids)
+                    self.assertAllEqual(ch.data, ref)
+                    self.assertAllEqual(ch[10:14, 1], ref[10:14, 1])
+                    self.assertAllEqual(data["other"].data, [0] * 12 + [2] * 18)
+
+                    ch.valid = [3, 11, 12, 20]
+                    self.assertAllEqual(ch.pids, pids[ch.valid])
+                    self.assertAllEqual(ch.data, ref[ch.valid])
+                    self.assertAllEqual(np.concatenate([batch for _, batch in ch.in_batches(3)]), ref[ch.valid])
+                    self.assertAllEqual(ch.apply_in_batches(lambda b: b.sum(axis=1), 3), ref[ch.valid].sum(axis=1))
+                    self.assertAllEqual(ch.to_dask().compute(), ref[ch.valid])
+                    with self.assertRaises(ValueError):
+                        ch.apply_in_batches(np.sum, workers=2, executor="process")
+
+                    data.drop_missing()
+                    self.assertAllEqual(data.pids, pids)
+                    self.assertAllEqual(ch.data, ref)
+                check_channel_closed(self, ch)
+
+        for fname in fnames:
+            os.remove(fname)
+
+
+    def test_concat_unordered(self):
+        acqs = {
+            "overlapping": ((np.arange(10), np.arange(8, 20)), (5, 5)),
+            "reversed":    ((np.arange(10, 20), np.arange(10)), (5, 5)),
+            "mismatch":    ((np.arange(10), np.arange(10, 20)), (5, 6))
+        }
+
+        for case, (pids, widths) in acqs.items():
+            fnames = []
+            for i, (p, w) in enumerate(zip(pids, widths)):
+                fname = make_temp_filename(prefix=f"acq{i:04}.", suffix=".h5")
+                with h5py.File(fname, "w") as f:
+                    f["data/ch/data"] = np.zeros((len(p), w))
+                    f["data/ch/pulse_id"] = p
+                fnames.append(fname)
+
+            if case == "mismatch":
+                with SFDataFiles(*fnames) as data:
+                    with self.assertRaises(ValueError) as cm:
+                        data["ch"].data
+                    self.assertIn("ch/data", str(cm.exception))
+            else:
+                with self.assertRaises(UnorderedPidsError):
+                    SFDataFiles(*fnames)
+                with SFDataFiles(*fnames, lazy=True) as data:
+                    with self.assertRaises(UnorderedPidsError):
+                        data["ch"].pids
+
+            for fname in fnames:
+                os.remove(fname)
+
+
 
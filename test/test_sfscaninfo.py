@@ -1,12 +1,26 @@
 #!/usr/bin/env python
 
+import os
+import json
+import shutil
+import tempfile
 import unittest.mock
+import warnings
+import h5py
+import numpy as np
 
-from utils import TestCase
+from utils import TestCase, check_channel_closed, make_temp_filename
+from consts import FNAME_ALL, CH_NAMES, CH_1D_NAME, CH_1D_DATA, CH_ND_NAME
 
 import sfdata
-from sfdata import SFScanInfo
+from sfdata import SFScanInfo, SFDataFile, SFDataFiles, write_vds, read_vds_steps
 from sfdata.errors import NoUsableFileError
+from sfdata.sfscaninfo import find_steps
+
+
+def sum_ch1(data):
+    return data[CH_1D_NAME].data.sum() # module-level for pickling
+
 
 
 class TestSFScanInfo(TestCase):
@@ -58,7 +72,7 @@ class TestSFScanInfo(TestCase):
     def test_broken(self, _):
 #        self.maxDiff = None
         modfname = sfdata.sfscaninfo.__file__
-        line = 57 #TODO this will break!
+        line = 150 #TODO this will break!
         prefix = f"{modfname}:{line}: UserWarning: "
         suffix = "\n  print_skip_warning(exc, sn)"
         msg_fmt = "Skipping step {} ['fake_data/run_test.ARRAYS.h5', 'fake_data/run_test.SCALARS.h5'] since it caused Exception: test"
@@ -78,7 +92,7 @@ class TestSFScanInfo(TestCase):
     def test_no_files(self):
 #        self.maxDiff = None
         modfname = sfdata.sfscaninfo.__file__
-        line = 57 #TODO this will break!
+        line = 150 #TODO this will break!
         prefix = f"{modfname}:{line}: UserWarning: "
         suffix = "\n  print_skip_warning(exc, sn)"
         msg_fmt = "Skipping step {} ['does not exist'] since it caused NoMatchingFileError: No matching file for patterns: \"does not exist\""
@@ -96,4 +110,184 @@ class TestSFScanInfo(TestCase):
                 pass
 
 
+    def test_iter_prefetch(self):
+        steps = self.scan.iter(prefetch=2, channels=[CH_1D_NAME, "does not exist"])
+        for step, ref in zip(steps, self.scan):
+            self.assertEqual(step.fnames, ref.fnames)
+            self.assertIn((step.files[1].fname, CH_1D_NAME, "data"), step.cache) # read in the background
+            self.assertAllEqual(step[CH_1D_NAME].data, CH_1D_DATA)
+
+        for step in self.scan.iter(prefetch=2):
+            break # also closes the prefetched steps
+        check_channel_closed(self, step[CH_1D_NAME])
+
+        msg_fmt = "Skipping step {} ['does not exist'] since it caused NoMatchingFileError: No matching file for patterns: \"does not exist\""
+        msg = (msg_fmt.format(i) for i in range(self.nsteps))
+        empty = SFScanInfo("fake_data/run_no_files.json")
+        with self.assertRaises(NoUsableFileError), self.assertWarns(*msg):
+            for step in empty.iter(prefetch=2):
+                pass
+
+
+    def test_map(self):
+        ref = [step[CH_1D_NAME].data.sum() for step in self.scan]
+        for workers, executor in ((None, "thread"), (2, "thread"), (2, "process")):
+            res = self.scan.map(sum_ch1, drop_missing=True, workers=workers, executor=executor)
+            self.assertEqual(len(res), len(self.scan.values))
+            np.testing.assert_allclose(res, [CH_1D_DATA[0] + CH_1D_DATA[2]] * self.nsteps) # pid 1 is missing in some channels
+        np.testing.assert_allclose(self.scan.map(sum_ch1, channels=[CH_1D_NAME, CH_ND_NAME], workers=2), ref)
+
+        with self.assertRaises(ZeroDivisionError): # errors in func are not skipped
+            self.scan.map(lambda data: 1 / 0, workers=2)
+
+        msg_fmt = "Skipping step {} ['does not exist'] since it caused NoMatchingFileError: No matching file for patterns: \"does not exist\""
+        msg = (msg_fmt.format(i) for i in range(self.nsteps))
+        empty = SFScanInfo("fake_data/run_no_files.json")
+        with self.assertRaises(NoUsableFileError), self.assertWarns(*msg):
+            empty.map(sum_ch1, workers=2)
+
+
+    def test_reduce(self):
+        with SFDataFiles(FNAME_ALL) as data:
+            ref = data[[CH_1D_NAME, CH_ND_NAME]]
+            ref.drop_missing()
+            ref_1d = ref[CH_1D_NAME].data
+            ref_nd = ref[CH_ND_NAME].data
+
+        bins = np.linspace(0, 10, 6)
+        for workers in (None, 2):
+            res = self.scan.reduce({CH_1D_NAME: ["mean", "std", "count", "hist"], CH_ND_NAME: ["mean", "max"]}, bins=bins, workers=workers)
+            self.assertAllEqual(res["DEVICE:AXIS"], self.scan.values)
+            self.assertAllEqual(res["DEVICE:AXIS_readback"], self.scan.readbacks)
+            self.assertAllEqual(res[f"{CH_1D_NAME}_count"], [len(ref_1d)] * self.nsteps)
+            np.testing.assert_allclose(res[f"{CH_1D_NAME}_mean"], [ref_1d.mean()] * self.nsteps)
+            np.testing.assert_allclose(res[f"{CH_1D_NAME}_std"], [ref_1d.std()] * self.nsteps)
+            self.assertAllEqual(res[f"{CH_1D_NAME}_hist"], [np.histogram(ref_1d, bins)[0]] * self.nsteps)
+            self.assertEqual(res[f"{CH_ND_NAME}_mean"].shape, (self.nsteps, *ref_nd.shape[1:]))
+            np.testing.assert_allclose(res[f"{CH_ND_NAME}_mean"][1], ref_nd.mean(axis=0))
+            self.assertAllEqual(res[f"{CH_ND_NAME}_max"][2], ref_nd.max(axis=0))
+            self.assertEqual(res[f"{CH_1D_NAME}_mean"].dims, ("DEVICE:AXIS",))
+            self.assertAllEqual(res["step"], range(self.nsteps))
+            np.testing.assert_allclose(res[f"{CH_ND_NAME}_mean"].sel({"DEVICE:AXIS": 100.2}), ref_nd.mean(axis=0))
+
+        with self.assertRaises(ValueError):
+            self.scan.reduce({CH_1D_NAME: "median"})
+        with self.assertRaises(ValueError):
+            self.scan.reduce({CH_1D_NAME: "hist"}) # needs bins
+
+
+    def test_pid_index(self):
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+        index_dir = os.path.join(tmp_dir, "index")
+
+        files = []
+        for i, (start, stop) in enumerate(((0, 10), (10, 20), (30, 40))):
+            fname = os.path.join(tmp_dir, f"step{i}.SCALARS.h5")
+            with h5py.File(fname, "w") as f:
+                f["data/a/data"] = np.arange(start, stop) * 10
+                f["data/a/pulse_id"] = np.arange(start, stop)
+                f["data/b/data"] = np.arange(start, stop - 1)
+                f["data/b/pulse_id"] = np.arange(start, stop - 1)
+            files.append([fname])
+        files.insert(1, [os.path.join(tmp_dir, "missing.h5")]) # step 1 cannot be opened
+
+        scan_fname = os.path.join(tmp_dir, "scan.json")
+        with open(scan_fname, "w") as f:
+            json.dump(dict(scan_files=files, scan_parameters=dict(name=["X"]), scan_values=[[1], [2], [3], [4]], scan_readbacks=[[1], [2], [3], [4]]), f)
+
+        for attempt in range(2): # the second time, the index is loaded
+            scan = SFScanInfo(scan_fname, meta_index=index_dir)
+            with warnings.catch_warnings(record=True) as caught:
+                warnings.simplefilter("always")
+                index = scan.pid_index
+            self.assertEqual(len(caught), 1 if attempt == 0 else 0) # the missing step is only reported when building the index
+            self.assertEqual(index, [dict(min=0, max=9, count=10), None, dict(min=10, max=19, count=10), dict(min=30, max=39, count=10)])
+
+        self.assertEqual(len(os.listdir(index_dir)), 1)
+        self.assertAllEqual(scan.step_of([5, 15, 25, 39, 40, -1]), [0, 2, -1, 3, -1, -1])
+        self.assertEqual(scan.step_of(12), 2)
+
+        selected = {i: step["a"].data for i, step in scan.select_pids([3, 4, 35])}
+        self.assertEqual(sorted(selected), [0, 3])
+        self.assertAllEqual(selected[0], [30, 40])
+        self.assertAllEqual(selected[3], [350])
+
+        with h5py.File(files[3][0], "a") as f: # changing a step file invalidates the index
+            f["data/a/pulse_id"][-1] = 45
+        scan = SFScanInfo(scan_fname, meta_index=index_dir)
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter("always")
+            self.assertEqual(scan.pid_index[3], dict(min=30, max=45, count=10))
+        self.assertEqual(len(caught), 1) # rebuilt
+
+        overlapping = [dict(min=0, max=20, count=21), None, dict(min=10, max=15, count=6), dict(min=30, max=39, count=10)]
+        msg = "1 pid(s) are within the overlapping pid ranges of several steps and are assigned to the step with the latest start"
+        with self.assertWarns(msg):
+            self.assertAllEqual(find_steps(overlapping, [5, 12, 18, 35, 25]), [0, 2, 0, 3, -1]) # only 12 is within two ranges
+
+
+    def test_write_vds(self):
+        fname = make_temp_filename(suffix=".h5")
+        os.remove(fname) # mode="x" needs a new file
+
+        self.scan.write_vds(fname)
+        with SFDataFile(fname) as data:
+            self.assertEqual(sorted(data.names), CH_NAMES)
+            ch = data[CH_1D_NAME]
+            self.assertTrue(ch.datasets.data.is_virtual)
+            self.assertAllEqual(ch.data, CH_1D_DATA * self.nsteps)
+            self.assertEqual(len(data[CH_ND_NAME]), 3 * self.nsteps)
+
+        with self.assertRaises(FileExistsError):
+            self.scan.write_vds(fname)
+
+        write_vds(fname, FNAME_ALL, mode="w")
+        with SFDataFile(fname) as data, SFDataFiles(FNAME_ALL) as ref:
+            for name in CH_NAMES:
+                self.assertAllEqual(data[name].data, ref[name].data)
+                self.assertAllEqual(data[name].pids, ref[name].pids)
+
+        os.remove(fname)
+
+
+    def test_write_vds_steps(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            files = []
+            for i, bounds in enumerate(((0, 5, 10), (10, 20), (20, 30))): # step 0 consists of two acquisitions
+                fnames = []
+                for j, (start, stop) in enumerate(zip(bounds[:-1], bounds[1:])):
+                    fname = os.path.join(tmp_dir, f"step{i}.acq{j}.SCALARS.h5")
+                    with h5py.File(fname, "w") as f:
+                        f["data/a/data"] = np.arange(start, stop) * 10
+                        f["data/a/pulse_id"] = np.arange(start, stop)
+                        if i != 1: # channel b is missing in step 1
+                            f["data/b/data"] = np.arange(start, stop)
+                            f["data/b/pulse_id"] = np.arange(start, stop)
+                    fnames.append(fname)
+                files.append(fnames)
+
+            scan_fname = os.path.join(tmp_dir, "scan.json")
+            with open(scan_fname, "w") as f:
+                json.dump(dict(scan_files=files, scan_parameters=dict(name=["X"]), scan_values=[[1], [2], [3]], scan_readbacks=[[1], [2], [3]]), f)
+
+            vds_fname = os.path.join(tmp_dir, "scan.vds.h5")
+            SFScanInfo(scan_fname).write_vds(vds_fname)
+
+            step_fnames, step_rows = read_vds_steps(vds_fname)
+            self.assertEqual(step_fnames, files)
+            self.assertEqual(step_rows["a"], [slice(0, 10), slice(10, 20), slice(20, 30)])
+            self.assertEqual(step_rows["b"], [slice(0, 10), slice(10, 10), slice(10, 20)])
+
+            with SFDataFile(vds_fname) as data:
+                for i, fnames in enumerate(step_fnames):
+                    with SFDataFiles(*fnames) as ref:
+                        for name in ref.names:
+                            ch = data[name]
+                            rows = step_rows[name][i]
+                            self.assertAllEqual(ch[rows], ref[name].data)
+                            self.assertAllEqual(ch.pids[rows], ref[name].pids)
+                self.assertEqual(len(data["b"][step_rows["b"][1]]), 0)
+
+
 
@@ -1,14 +1,30 @@
 #!/usr/bin/env python
 
+import os
+import threading
+import warnings
+from functools import reduce
+import h5py
+import bitshuffle.h5
 import numpy as np
 import pandas as pd
 
-from utils import TestCase
+from utils import TestCase, make_temp_filename
 from consts import FNAME_ARRAYS, FNAME_SCALARS, CH_ND_DATA1
 
 from sfdata import SFDataFile
-from sfdata.utils import print_line, cprint, typename, maxstrlen, strlen, percentage_missing, dip, decide_color, json_load, h5_boolean_indexing, decide_pandas_dtype, apply_batched, batched
-from sfdata.utils.np import nothing_like
+from sfdata.utils import print_line, cprint, typename, maxstrlen, strlen, percentage_missing, dip, decide_color, json_load, h5_boolean_indexing, decide_pandas_dtype, make_wide_dataframe, make_filled_column, apply_batched, batched
+from sfdata.utils.batching import chunk_batch_slices, auto_batch_rows, read_batch, BatchBuffers
+from sfdata.utils.parallel import parallel_map, prefetched
+from sfdata.utils.warn import WarningCollector
+from sfdata.utils.pids import intersect_pids, union_pids, shared_indices
+from sfdata.utils.cache import LRUCache, ChannelCache, make_cache
+from sfdata.utils.np import nothing_like, contiguous_runs, is_strictly_increasing
+from sfdata.utils.h5 import h5_read_valid, h5_read_runs, use_full_read
+from sfdata.utils.da import dask_read_valid
+from sfdata.utils.mmap import mmap_dataset, mmap_read_valid
+from sfdata.utils.directchunk import wrap_direct_chunks, supports_direct_chunks, DirectChunkDataset
+from sfdata.utils.stats import RunningStats, centred_squares_sum, BLOCK_BYTES
 from sfdata.utils.progress import bar, percentage # not actually used anywhere
 
 
@@ -68,6 +84,386 @@ class TestUtils(TestCase):
             )
 
 
+    def test_np_contiguous_runs(self):
+        starts, stops = contiguous_runs([])
+        self.assertAllEqual(starts, [])
+        self.assertAllEqual(stops, [])
+
+        starts, stops = contiguous_runs([1, 2, 3, 7, 8, 10])
+        self.assertAllEqual(starts, [1, 7, 10])
+        self.assertAllEqual(stops, [4, 9, 11])
+
+    def test_np_is_strictly_increasing(self):
+        self.assertTrue(is_strictly_increasing([]))
+        self.assertTrue(is_strictly_increasing([0, 2, 5]))
+        self.assertFalse(is_strictly_increasing([0, 2, 2]))
+        self.assertFalse(is_strictly_increasing([2, 0, 5]))
+
+
+    def test_h5_read_valid(self):
+        fname = make_temp_filename(suffix=".h5")
+        ref = np.arange(1000 * 16 * 16, dtype=float).reshape(1000, 16, 16) # 2 kB per row, 2 MB in total
+
+        with h5py.File(fname, "w") as f:
+            f["data"] = ref
+            ds = f["data"]
+
+            sparse = np.arange(0, 1000, 10)
+            self.assertFalse(use_full_read(ds, len(sparse), len(sparse)))
+            dense = np.arange(0, 1000, 2)
+            self.assertTrue(use_full_read(ds, len(dense), len(dense)))
+
+            valids = (
+                sparse,
+                dense,
+                [],
+                list(range(100, 200)) + list(range(500, 600)), # two runs
+                [3, 1, 2], # unsorted
+                ref[:, 0, 0] % 3 == 0 # boolean
+            )
+
+            for valid in valids:
+                self.assertAllEqual(
+                    h5_read_valid(ds, valid), ref[valid]
+                )
+
+            self.assertAllEqual(
+                h5_read_valid(ds, Ellipsis), ref
+            )
+
+        os.remove(fname)
+
+    def test_h5_read_runs(self):
+        fname = make_temp_filename(suffix=".h5")
+        ref = np.arange(20).reshape(10, 2)
+
+        with h5py.File(fname, "w") as f:
+            f["data"] = ref
+            ds = f["data"]
+
+            res = h5_read_runs(ds, [1, 5], [3, 6])
+            self.assertAllEqual(res, ref[[1, 2, 5]])
+            self.assertEqual(res.dtype, ref.dtype)
+
+            out = np.zeros((3, 2), dtype=ref.dtype)
+            res = h5_read_runs(ds, [1, 5], [3, 6], out=out)
+            self.assertIs(res, out)
+            self.assertAllEqual(out, ref[[1, 2, 5]])
+
+            res = h5_read_runs(ds, [], [])
+            self.assertEqual(res.shape, (0, 2))
+
+        os.remove(fname)
+
+
+    def test_dask_read_valid(self):
+        fname = make_temp_filename(suffix=".h5")
+        ref = np.arange(1000 * 4 * 4, dtype=np.uint16).reshape(1000, 4, 4)
+
+        with h5py.File(fname, "w") as f:
+            ds = f.create_dataset("data", data=ref, chunks=(10, 4, 4))
+
+            res = dask_read_valid(ds, Ellipsis)
+            self.assertEqual(res.dtype, ref.dtype)
+            self.assertEqual(res.chunks[1:], ((4,), (4,)))
+            self.assertAllEqual(res.compute(), ref)
+
+            valids = (
+                np.arange(0, 1000, 7),
+                ref[:, 0, 0] % 3 == 0,
+                []
+            )
+            for valid in valids:
+                res = dask_read_valid(ds, valid)
+                self.assertAllEqual(res.compute(), ref[valid])
+
+            f["col"] = ref[:, :1, 0]
+            res = dask_read_valid(f["col"], Ellipsis)
+            self.assertEqual(res.shape, (1000,))
+            self.assertAllEqual(res.compute(), ref[:, 0, 0])
+
+        os.remove(fname)
+
+    def test_direct_chunks(self):
+        fname = make_temp_filename(suffix=".h5")
+        ref = np.arange(50 * 6 * 4, dtype=np.uint16).reshape(50, 6, 4)
+        bslz4 = dict(compression=bitshuffle.h5.H5FILTER, compression_opts=(0, bitshuffle.h5.H5_COMPRESS_LZ4))
+
+        with h5py.File(fname, "w") as f:
+            ds = f.create_dataset("data", data=ref, chunks=(4, 6, 4), **bslz4)
+            f.create_dataset("split", data=ref, chunks=(4, 3, 4), **bslz4) # rows spread over several chunks
+            f.create_dataset("gzip", data=ref, chunks=(4, 6, 4), compression="gzip")
+            f["contiguous"] = ref
+
+            self.assertTrue(supports_direct_chunks(ds))
+            for name in ("split", "gzip", "contiguous"):
+                other = f[name]
+                self.assertFalse(supports_direct_chunks(other))
+                self.assertIs(wrap_direct_chunks(other, 2), other)
+
+            self.assertIs(wrap_direct_chunks(ds, None), ds)
+            for workers in (1, 3):
+                dcd = wrap_direct_chunks(ds, workers)
+                self.assertIsInstance(dcd, DirectChunkDataset)
+                self.assertEqual(dcd.shape, ref.shape)
+                self.assertEqual(len(dcd), len(ref))
+
+                keys = (
+                    slice(None), Ellipsis, 7, -1, slice(3, 17, 2),
+                    [49, 0, 5, 5], # unsorted with duplicates
+                    ref[:, 0, 0] % 3 == 0,
+                    (slice(10, 20), slice(1, 3)),
+                    (12, 2, 3)
+                )
+                for key in keys:
+                    self.assertAllEqual(dcd[key], ref[key])
+
+                self.assertAllEqual(h5_read_valid(dcd, np.arange(0, 50, 9)), ref[::9])
+                self.assertAllEqual(read_batch(dcd, np.arange(10, 30, 3), buffers=BatchBuffers(dcd)), ref[10:30:3])
+
+        os.remove(fname)
+
+    def test_mmap(self):
+        fname = make_temp_filename(suffix=".h5")
+        ref = np.arange(100 * 3, dtype=">i4").reshape(100, 3) # also check byte order
+
+        with h5py.File(fname, "w") as f:
+            f["contiguous"] = ref
+            f.create_dataset("chunked", data=ref, chunks=(10, 3))
+            f.create_dataset("empty", shape=(0, 3), dtype=float)
+
+        with h5py.File(fname, "r") as f:
+            for name in ("chunked", "empty"):
+                self.assertIsNone(mmap_dataset(f[name]))
+            self.assertIsNone(mmap_dataset(ref))
+
+            mm = mmap_dataset(f["contiguous"])
+            self.assertIsInstance(mm, np.memmap)
+            self.assertEqual(mm.dtype, ref.dtype)
+            self.assertAllEqual(mm, ref)
+
+            self.assertIs(mmap_read_valid(mm, Ellipsis), mm)
+
+            res = mmap_read_valid(mm, np.arange(10, 20)) # single run -> view
+            self.assertAllEqual(res, ref[10:20])
+            self.assertTrue(np.shares_memory(res, mm))
+
+            for valid in (np.arange(0, 100, 7), ref[:, 0] % 2 == 0, [5, 3], []):
+                self.assertAllEqual(mmap_read_valid(mm, valid), ref[valid])
+
+        os.remove(fname)
+
+    def test_lru_cache(self):
+        cache = LRUCache(max_nbytes=100)
+        a = np.zeros(5) # 40 bytes each
+        b = np.ones(5)
+        c = np.arange(5.)
+
+        cache.put("a", a)
+        cache.put("b", b)
+        self.assertEqual(cache.nbytes, 80)
+        self.assertIs(cache.get("a"), a) # a is now the most recently used
+
+        cache.put("c", c) # evicts b
+        self.assertNotIn("b", cache)
+        self.assertIn("a", cache)
+        self.assertIn("c", cache)
+        self.assertEqual(cache.nbytes, 80)
+        self.assertIsNone(cache.get("b"))
+
+        cache.put("too large", np.zeros(20))
+        self.assertNotIn("too large", cache)
+        self.assertEqual(len(cache), 2)
+
+        cache.pop("a")
+        self.assertEqual(cache.nbytes, 40)
+        cache.clear()
+        self.assertEqual(cache.nbytes, 0)
+        self.assertEqual(len(cache), 0)
+
+    def test_make_cache(self):
+        self.assertIsNone(make_cache())
+        self.assertIsNone(make_cache(False))
+
+        cache = make_cache("pids")
+        self.assertEqual(cache.which, {"pids"})
+        self.assertIs(make_cache(cache), cache)
+
+        cache = make_cache(True, 123)
+        self.assertEqual(cache.which, {"pids", "data", "timestamps"})
+        self.assertEqual(cache.max_nbytes, 123)
+
+        cache = make_cache(max_nbytes=123)
+        self.assertEqual(cache.which, {"pids", "data", "timestamps"})
+
+        cache = make_cache(["pids", "timestamps"])
+        self.assertEqual(cache.which, {"pids", "timestamps"})
+
+        with self.assertRaises(ValueError):
+            make_cache("not a dataset")
+
+    def test_channel_cache_invalidate(self):
+        cache = ChannelCache()
+        cache.put(("file", "ch1", "pids"), np.zeros(1))
+        cache.put(("file", "ch1", "data"), np.zeros(1))
+        cache.put(("file", "ch2", "data"), np.zeros(1))
+        cache.invalidate("file", "ch1")
+        self.assertEqual(list(cache.entries), [("file", "ch2", "data")])
+
+
+    def test_parallel_map(self):
+        def func(i):
+            warnings.warn(f"warning {i}")
+            return i * 2
+
+        for workers in (None, 1, 4):
+            with warnings.catch_warnings(record=True) as caught:
+                warnings.simplefilter("always")
+                res = list(parallel_map(func, range(10), workers=workers))
+            self.assertEqual(res, [i * 2 for i in range(10)])
+            messages = [str(w.message) for w in caught]
+            self.assertEqual(messages, [f"warning {i}" for i in range(10)])
+
+        def fail(i):
+            raise ValueError(i)
+
+        with self.assertRaises(ValueError):
+            list(parallel_map(fail, range(3), workers=2))
+
+
+    def test_warning_collector_other_threads(self):
+        def other():
+            warnings.warn("from other thread")
+
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter("always")
+            with WarningCollector() as collector:
+                collector.run("key", warnings.warn, "from run")
+                thread = threading.Thread(target=other)
+                thread.start()
+                thread.join()
+            self.assertEqual([str(w.message) for w in caught], ["from other thread"])
+            collector.reissue("key")
+        self.assertEqual([str(w.message) for w in caught], ["from other thread", "from run"])
+
+
+    def test_prefetched(self):
+        items = list(range(20))
+        for n in (None, 0, 1, 3, 100):
+            self.assertEqual(list(prefetched(items, n)), items)
+
+        def failing():
+            yield 1
+            raise ValueError("failing")
+
+        gen = prefetched(failing(), 2)
+        self.assertEqual(next(gen), 1)
+        with self.assertRaises(ValueError):
+            next(gen)
+
+        produced = []
+        def producing():
+            for i in range(100):
+                produced.append(i)
+                yield i
+
+        threads_before = threading.active_count()
+        for i in prefetched(producing(), 3):
+            if i == 5:
+                break
+        self.assertLessEqual(len(produced), 5 + 3 + 2) # consumed + queued + one blocked in put
+        self.assertEqual(threading.active_count(), threads_before)
+
+
+    def test_prefetched_warnings(self):
+        produced = threading.Event()
+
+        def batches():
+            for i in range(2):
+                warnings.warn(f"producing {i}")
+                yield list(parallel_map(lambda j: warnings.warn(f"nested {i}.{j}"), range(2), workers=2)) # nested collector in the background thread
+            produced.set()
+            warnings.warn("exhausted")
+
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter("always")
+            for i, batch in enumerate(prefetched(batches(), 2)):
+                self.assertTrue(produced.wait(10)) # both batches are produced before the first is consumed
+                warnings.warn(f"consuming {i}")
+
+        messages = [str(w.message) for w in caught]
+        self.assertEqual(messages, ["producing 0", "nested 0.0", "nested 0.1", "consuming 0", "producing 1", "nested 1.0", "nested 1.1", "consuming 1", "exhausted"])
+
+
+    def test_pids_sets(self):
+        rng = np.random.default_rng(0)
+
+        def check(arrays):
+            shared = reduce(np.intersect1d, arrays)
+            self.assertAllEqual(intersect_pids(arrays), shared)
+            self.assertAllEqual(union_pids(arrays), reduce(np.union1d, arrays))
+            for chunk_size in (7, 1000, 2**24):
+                valids = shared_indices(arrays, chunk_size=chunk_size)
+                for a, valid in zip(arrays, valids):
+                    ref = np.intersect1d(a, shared, return_indices=True)[1]
+                    self.assertAllEqual(valid, ref)
+
+        base = np.arange(10**9, 10**9 + 1000)
+        dense  = [np.sort(rng.choice(base, 900, replace=False)) for _ in range(5)] # bitmap
+        sparse = [np.sort(rng.choice(base * 1000, 900, replace=False)) for _ in range(5)] # searchsorted / merge
+        unsorted = [rng.permutation(a) for a in dense]
+        duplicates = [np.sort(rng.choice(base, 900)) for _ in range(5)]
+        disjoint = [base[:10], base[20:30]]
+        empty = [base, base[:0]]
+
+        for arrays in (dense, sparse, unsorted, duplicates, disjoint, empty):
+            check(arrays)
+
+        res = intersect_pids([[0, 1, 2], [0, 2]])
+        self.assertAllEqual(res, [0, 2])
+        res = union_pids([[0, 2], [0, 1, 2]])
+        self.assertAllEqual(res, [0, 1, 2])
+
+        res = union_pids([np.array([0, 2], dtype=np.int32), np.array([1], dtype=np.int64)])
+        self.assertEqual(res.dtype, np.int64)
+
+        mixed = [np.arange(0, 20, dtype=np.uint64), np.arange(5, 30, 2, dtype=np.int64)] # e.g., JF next to BSREAD
+        self.assertAllEqual(intersect_pids(mixed), reduce(np.intersect1d, mixed))
+        self.assertAllEqual(union_pids(mixed), reduce(np.union1d, mixed))
+        for a, idx in zip(mixed, shared_indices(mixed)):
+            self.assertAllEqual(a[idx], np.arange(5, 20, 2))
+
+
+    def test_running_stats(self):
+        data = np.random.default_rng(0).normal(1e6, 3, size=(100, 4, 5)) # large offset to check numerical stability
+        bins = np.linspace(1e6 - 10, 1e6 + 10, 21)
+        stats = RunningStats(bins=bins)
+        for i in range(0, 100, 30): # uneven batches
+            stats.update(data[i:i+30])
+        stats.update(data[:0])
+
+        self.assertEqual(stats.count, 100)
+        np.testing.assert_allclose(stats.mean, data.mean(axis=0))
+        np.testing.assert_allclose(stats.std, data.std(axis=0))
+        np.testing.assert_allclose(stats.get("sum"), data.sum(axis=0))
+        self.assertAllEqual(stats.min, data.min(axis=0))
+        self.assertAllEqual(stats.max, data.max(axis=0))
+        self.assertAllEqual(stats.hist, np.histogram(data, bins)[0])
+
+        images = np.random.default_rng(1).integers(0, 2**16, size=(7, 3, 4), dtype=np.uint16)
+        mean = images.mean(axis=0)
+        ref = np.square(images - mean).sum(axis=0)
+        for block_bytes in (1, 3 * 4 * 8 * 2, BLOCK_BYTES): # one row, two rows, all rows per block
+            np.testing.assert_allclose(centred_squares_sum(images, mean, block_bytes), ref)
+
+        empty = RunningStats()
+        self.assertEqual(empty.count, 0)
+        self.assertIsNone(empty.mean)
+        self.assertIsNone(empty.std)
+        with self.assertRaises(ValueError):
+            empty.get("median")
+
+
     def test_json_load(self):
         ref = {
             "test int": 1,
@@ -190,6 +586,57 @@ class TestUtils(TestCase):
                 self.assertAllEqual(res, arr[:m*n])
 
 
+    def test_apply_batched_dtype(self):
+        arr = np.arange(10, dtype=np.uint16)
+        nop = lambda x: x
+
+        res = apply_batched(nop, arr, arr, 3)
+        self.assertEqual(res.dtype, arr.dtype)
+
+        res = apply_batched(lambda x: x > 4, arr, arr, 3)
+        self.assertEqual(res.dtype, bool)
+        self.assertAllEqual(res, arr > 4)
+
+        res = apply_batched(nop, arr, arr, 3, dtype=np.float32)
+        self.assertEqual(res.dtype, np.float32)
+        self.assertAllEqual(res, arr)
+
+        res = apply_batched(nop, arr, arr, 3, nbatches=0, dtype=np.float32)
+        self.assertEqual(res.dtype, np.float32)
+
+        promote = lambda x: x / 2 if x[0] > 0 else x # first batch is int, later batches are float
+        res = apply_batched(promote, arr, arr, 3)
+        self.assertEqual(res.dtype, float)
+        self.assertAllEqual(res, [0, 1, 2] + list(arr[3:] / 2))
+
+        out = np.zeros(10, dtype=np.int64)
+        res = apply_batched(nop, arr, arr, 3, out=out)
+        self.assertIs(res, out)
+        self.assertAllEqual(out, arr)
+
+        with self.assertRaises(ValueError):
+            apply_batched(nop, arr, arr, 3, out=np.zeros(5))
+
+
+    def test_apply_batched_ragged(self):
+        arr = np.arange(10)
+
+        ranges = lambda x: [np.arange(i) for i in x] # different shape per entry
+        res = apply_batched(ranges, arr, arr, 3)
+        self.assertEqual(res.shape, (10,))
+        self.assertEqual(res.dtype, object)
+        for i, r in zip(arr, res):
+            self.assertAllEqual(r, np.arange(i))
+
+        per_batch = lambda x: np.ones((len(x), x[0])) # different shape per batch
+        res = apply_batched(per_batch, arr, arr, 3)
+        self.assertEqual(res.dtype, object)
+        self.assertEqual([r.shape for r in res], [(0,)] * 3 + [(3,)] * 3 + [(6,)] * 3 + [(9,)])
+
+        with self.assertRaises(ValueError):
+            apply_batched(per_batch, arr, arr, 3, out=np.zeros((10, 0)))
+
+
     def test_batched(self):
         arr = np.arange(3)
 
@@ -232,6 +679,71 @@ class TestUtils(TestCase):
             compare(res, ref[:1])
 
 
+    def test_chunk_batch_slices(self):
+        fname = make_temp_filename(suffix=".h5")
+        ref = np.arange(100 * 8, dtype=np.float64).reshape(100, 8) # 64 bytes per row
+
+        with h5py.File(fname, "w") as f:
+            ds = f.create_dataset("data", data=ref, chunks=(10, 8)) # 640 bytes per chunk
+
+            self.assertEqual(auto_batch_rows(ds, 2000), 30) # three chunks
+            self.assertEqual(auto_batch_rows(ds, 100), 10) # at least one chunk
+            self.assertEqual(auto_batch_rows(ref, 2000), 31) # no chunks
+
+            indices = np.r_[0:5, 12, 25:35, 95:100]
+            slices = list(chunk_batch_slices(ds, indices, 2000))
+            self.assertEqual([s for s, _ in slices], [slice(0, 11), slice(11, 16), slice(16, 21)])
+            for s, batch_indices in slices:
+                self.assertAllEqual(batch_indices, indices[s])
+                chunk_groups = set(batch_indices // 30)
+                self.assertEqual(len(chunk_groups), 1) # each chunk in exactly one batch
+
+            slices = list(chunk_batch_slices(ds, indices, 2000, nbatches=2))
+            self.assertEqual(len(slices), 2)
+            self.assertEqual(list(chunk_batch_slices(ds, [], 2000)), [])
+
+            res = np.concatenate([b for _, b in batched(ds, indices, "auto", max_bytes=2000)])
+            self.assertAllEqual(res, ref[indices])
+
+            res = apply_batched(lambda x: x.sum(axis=1), ds, indices, "auto", max_bytes=2000)
+            self.assertAllEqual(res, ref[indices].sum(axis=1))
+
+            res = apply_batched(lambda x: x.sum(axis=1), ds, indices, "auto", nbatches=1, max_bytes=2000)
+            self.assertAllEqual(res, ref[indices[:11]].sum(axis=1))
+
+        os.remove(fname)
+
+
+    def test_read_batch(self):
+        fname = make_temp_filename(suffix=".h5")
+        ref = np.arange(1000 * 16 * 16, dtype=float).reshape(1000, 16, 16) # 2 kB per row, 2 MB in total
+
+        with h5py.File(fname, "w") as f:
+            f["data"] = ref
+            ds = f["data"]
+
+            batches = (
+                np.arange(0, 1000, 10), # sparse -> runs
+                np.arange(0, 1000, 2), # dense -> span
+                np.arange(100, 200),
+                np.array([5])
+            )
+
+            buffers = BatchBuffers(ds)
+            for batch_indices in batches:
+                self.assertAllEqual(read_batch(ds, batch_indices), ref[batch_indices])
+                self.assertAllEqual(read_batch(ref, batch_indices), ref[batch_indices])
+                res = read_batch(ds, batch_indices, buffers=buffers)
+                self.assertAllEqual(res, ref[batch_indices])
+                self.assertIs(res.base, buffers.arrays["batch"])
+
+            res1 = [b for _, b in batched(ds, np.arange(0, 1000, 10), 10, reuse_buffer=True)]
+            self.assertIs(res1[0].base, res1[-1].base) # all batches share one buffer
+            self.assertAllEqual(res1[-1], ref[900:1000:10])
+
+        os.remove(fname)
+
+
     def test_decide_pandas_dtype(self):
         base_arr = np.arange(4)
 
@@ -259,4 +771,44 @@ class TestUtils(TestCase):
             self.assertEqual(res, tout)
 
 
+    def test_make_wide_dataframe_empty(self):
+        for shape, ncols in (((0,), 1), ((0, 3), 3), ((0, 2, 4), 8)):
+            for as_nullable in (False, True):
+                df = make_wide_dataframe("ch", np.array([], dtype=int), np.zeros(shape), as_nullable=as_nullable)
+                self.assertEqual(df.shape, (0, ncols))
+                self.assertEqual(df.columns.get_level_values(0).unique().tolist(), ["ch"])
+
+
+    def test_make_filled_column(self):
+        rows = np.array([0, 2, 3])
+
+        res = make_filled_column(5, rows, np.array([1, 2, 3]))
+        self.assertEqual(res.dtype, object)
+        self.assertEqual(res[[0, 2, 3]].tolist(), [1, 2, 3])
+        self.assertTrue(np.isnan(res[1]) and np.isnan(res[4]))
+
+        res = make_filled_column(5, rows, np.array([1, 2, 3]), as_nullable=True)
+        self.assertEqual(res.dtype, pd.Int64Dtype())
+        self.assertEqual(res.isna().tolist(), [False, True, False, False, True])
+
+        res = make_filled_column(5, rows, np.array([True, False, True]), as_nullable=True)
+        self.assertEqual(res.dtype, pd.BooleanDtype())
+        self.assertEqual(res[0], True)
+        self.assertEqual(res[2], False)
+
+        res = make_filled_column(5, rows, np.array([1., 2., 3.]), as_nullable=True)
+        self.assertEqual(res.dtype, float)
+        self.assertTrue(np.isnan(res[1]))
+
+        data = np.arange(6).reshape(3, 2)
+        for as_nullable in (False, True):
+            res = make_filled_column(5, rows, data, as_nullable=as_nullable)
+            self.assertEqual(res.dtype, object)
+            self.assertTrue(np.array_equal(res[3], [4, 5]))
+            self.assertTrue(np.isnan(res[4]))
+
+        res = make_filled_column(5, rows, data, as_lists=True)
+        self.assertEqual(res[2], [2, 3])
+
+
 